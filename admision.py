@@ -0,0 +1,193 @@
+"""Control de admisión y contrapresión para ráfagas de reservas.
+
+Lecturas y escrituras usan colas SEPARADAS, así una avalancha de `/agendar`
+nunca deja esperando al calendario. Las escrituras pasan de a una (SQLite
+tiene un solo escritor) por una cola justa por doctor: se atiende un turno de
+cada doctor en ronda, de modo que la agenda de un especialista muy pedido no
+acapara el servidor. Si la cola está llena se responde 429 con Retry-After
+al instante, sin abrir sesión ni tocar la BD.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+from fastapi import Form
+
+
+class Saturado(Exception):
+    """La cola está llena: el cliente debe reintentar después de `retry_after` segundos"""
+
+    def __init__(self, cola, retry_after):
+        super().__init__(f"Cola '{cola}' llena")
+        self.cola = cola
+        self.retry_after = retry_after
+
+
+class _Metricas:
+    """Contadores comunes de una cola"""
+
+    def __init__(self, nombre, concurrencia, max_cola):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.max_cola = max_cola
+        self.activos = 0
+        self.pico_cola = 0
+        self.admitidos = 0
+        self.rechazados = 0
+        self._servicio_medio = 0.05  # Segundos por petición (media móvil)
+
+    def _retry_after(self, en_cola):
+        """Segundos estimados hasta que se libere lugar"""
+        return max(1, math.ceil(en_cola * self._servicio_medio / self.concurrencia))
+
+    def _anotar_servicio(self, segundos):
+        self._servicio_medio = 0.9 * self._servicio_medio + 0.1 * segundos
+
+    def metricas(self, en_cola):
+        return {
+            "concurrencia": self.concurrencia,
+            "max_cola": self.max_cola,
+            "activos": self.activos,
+            "en_cola": en_cola,
+            "pico_cola": self.pico_cola,
+            "admitidos": self.admitidos,
+            "rechazados": self.rechazados,
+            "servicio_medio_ms": round(self._servicio_medio * 1000, 1),
+        }
+
+
+class ColaAdmision(_Metricas):
+    """Concurrencia acotada + cola FIFO acotada (para lecturas)"""
+
+    def __init__(self, nombre, concurrencia=8, max_cola=64):
+        super().__init__(nombre, concurrencia, max_cola)
+        self._esperando = deque()
+
+    async def entrar(self):
+        if self.activos < self.concurrencia and not self._esperando:
+            self.activos += 1
+        else:
+            if len(self._esperando) >= self.max_cola:
+                self.rechazados += 1
+                raise Saturado(self.nombre, self._retry_after(len(self._esperando)))
+            turno = asyncio.get_running_loop().create_future()
+            self._esperando.append(turno)
+            self.pico_cola = max(self.pico_cola, len(self._esperando))
+            try:
+                await turno
+            except asyncio.CancelledError:
+                if turno.done() and not turno.cancelled():
+                    self.salir(0)  # Ya nos habían dado el lugar: devolverlo
+                elif turno in self._esperando:  # salir() pudo sacarlo ya (y descartarlo)
+                    self._esperando.remove(turno)
+                raise
+        self.admitidos += 1
+        return time.perf_counter()
+
+    def salir(self, inicio):
+        if inicio:
+            self._anotar_servicio(time.perf_counter() - inicio)
+        self.activos -= 1
+        while self._esperando and self.activos < self.concurrencia:
+            turno = self._esperando.popleft()
+            if not turno.done():
+                self.activos += 1
+                turno.set_result(None)
+
+    def metricas(self):
+        return super().metricas(len(self._esperando))
+
+
+class ColaEscrituraPorDoctor(_Metricas):
+    """Cola justa por doctor: un turno por doctor en ronda (round-robin)"""
+
+    def __init__(self, nombre, concurrencia=1, max_cola=64, max_por_doctor=16):
+        super().__init__(nombre, concurrencia, max_cola)
+        self.max_por_doctor = max_por_doctor
+        self._colas = OrderedDict()  # doctor_id -> deque de turnos
+        self._en_cola = 0
+
+    async def entrar(self, doctor_id):
+        if self.activos < self.concurrencia and not self._colas:
+            self.activos += 1
+        else:
+            cola = self._colas.get(doctor_id)
+            if self._en_cola >= self.max_cola or (cola and len(cola) >= self.max_por_doctor):
+                self.rechazados += 1
+                raise Saturado(self.nombre, self._retry_after(self._en_cola))
+            turno = asyncio.get_running_loop().create_future()
+            self._colas.setdefault(doctor_id, deque()).append(turno)
+            self._en_cola += 1
+            self.pico_cola = max(self.pico_cola, self._en_cola)
+            try:
+                await turno
+            except asyncio.CancelledError:
+                if turno.done() and not turno.cancelled():
+                    self.salir(0)
+                else:
+                    self._quitar(doctor_id, turno)
+                raise
+        self.admitidos += 1
+        return time.perf_counter()
+
+    def _quitar(self, doctor_id, turno):
+        """Saca un turno cancelado, si salir() no lo sacó ya"""
+        cola = self._colas.get(doctor_id)
+        if cola is None or turno not in cola:
+            return
+        cola.remove(turno)
+        self._en_cola -= 1
+        if not cola:
+            del self._colas[doctor_id]
+
+    def salir(self, inicio):
+        if inicio:
+            self._anotar_servicio(time.perf_counter() - inicio)
+        self.activos -= 1
+        while self._colas and self.activos < self.concurrencia:
+            # Primer doctor de la ronda: atendemos UNO de sus turnos y lo mandamos al final
+            doctor_id, cola = self._colas.popitem(last=False)
+            turno = cola.popleft()
+            self._en_cola -= 1
+            if cola:
+                self._colas[doctor_id] = cola
+            if not turno.done():
+                self.activos += 1
+                turno.set_result(None)
+
+    def metricas(self):
+        datos = super().metricas(self._en_cola)
+        datos["doctores_en_cola"] = {str(d): len(c) for d, c in self._colas.items()}
+        return datos
+
+
+# --- COLAS DEL SISTEMA (una instancia por worker) ---
+COLAS = {}
+
+def lectura(ruta, concurrencia=8, max_cola=64):
+    """Dependencia de FastAPI: limita la concurrencia de una ruta de lectura"""
+    cola = COLAS[ruta] = ColaAdmision(ruta, concurrencia, max_cola)
+
+    async def admitir_lectura():
+        inicio = await cola.entrar()
+        try:
+            yield
+        finally:
+            cola.salir(inicio)
+
+    return admitir_lectura
+
+escrituras = COLAS["/agendar"] = ColaEscrituraPorDoctor("/agendar")
+
+async def admitir_escritura(doctor_id: int = Form(...)):
+    """Dependencia de FastAPI: turno en la cola justa de escrituras del doctor"""
+    inicio = await escrituras.entrar(doctor_id)
+    try:
+        yield
+    finally:
+        escrituras.salir(inicio)
+
+def metricas():
+    """Profundidad de cola y contadores de todas las colas"""
+    return {nombre: cola.metricas() for nombre, cola in COLAS.items()}
@@ -0,0 +1,146 @@
+"""Bitácora de cambios (tabla `cambios`) y sincronización delta para recepciones.
+
+Cada INSERT/UPDATE/DELETE de Cita, Paciente o Doctor hecho con el ORM deja una
+fila en `cambios` durante el mismo flush, o sea en la MISMA transacción que el
+cambio. Las actualizaciones masivas (`query.update()`) no pasan por el flush:
+para esas se usa `registrar_consulta()` antes del UPDATE.
+
+SQLite admite un solo escritor a la vez, así que los ids de `cambios` se
+confirman en orden y sirven directamente como cursor de `/api/sync`.
+`/api/sync` exige sesión de admin o el token de una recepción.
+
+Cada respuesta lleva la `generacion` de la bitácora. Solo cambia cuando se
+restaura un respaldo (ver respaldo.py): entonces el cliente descarta su copia
+y vuelve a pedir desde `since=0`.
+"""
+import hmac
+import os
+
+from sqlalchemy import delete, event, func, inspect, insert, literal, select
+
+import database, models
+
+# Clave de versiones_cache con la generación de la bitácora
+CLAVE_GENERACION = "bitacora"
+
+# Tokens de las PCs de recepción, separados por comas (ej: "recepcion1-xxxx,recepcion2-yyyy")
+TOKENS_RECEPCION = [t.strip() for t in os.environ.get("MEDICITAS_TOKENS_SYNC", "").split(",") if t.strip()]
+
+# Modelos que viajan a las recepciones -> nombre de la tabla en la bitácora
+MODELOS_SYNC = {
+    models.Doctor: "doctores",
+    models.Paciente: "pacientes",
+    models.Cita: "citas",
+}
+
+
+def registrar(db, tabla, ids, operacion="guardado"):
+    """Anota cambios explícitos (se confirman con el próximo db.commit())"""
+    filas = [{"tabla": tabla, "registro_id": i, "operacion": operacion} for i in ids]
+    if filas:
+        db.execute(insert(models.Cambio), filas)
+
+
+def registrar_consulta(db, tabla, consulta_ids, operacion="guardado"):
+    """Anota en un solo INSERT ... SELECT los ids que devuelve `consulta_ids`"""
+    db.execute(
+        insert(models.Cambio).from_select(
+            ["tabla", "registro_id", "operacion"],
+            select(literal(tabla), consulta_ids.subquery().c[0], literal(operacion)),
+        )
+    )
+
+
+def sembrar_bitacora(db):
+    """Si la bitácora está vacía, anota todos los registros existentes (cursor 0 = copia completa)"""
+    if db.query(models.Cambio.id).first():
+        return
+    for modelo, tabla in MODELOS_SYNC.items():
+        registrar_consulta(db, tabla, select(modelo.id).order_by(modelo.id))
+    db.commit()
+
+
+def compactar(db):
+    """Deja solo el último cambio de cada registro (la sync siempre manda el estado actual).
+
+    Un cliente con cualquier cursor sigue recibiendo todo lo que le falta: si
+    borramos un cambio viejo es porque hay otro más nuevo del mismo registro.
+    """
+    ultimos = select(func.max(models.Cambio.id)).group_by(models.Cambio.tabla, models.Cambio.registro_id)
+    borrados = db.execute(delete(models.Cambio).where(models.Cambio.id.not_in(ultimos))).rowcount
+    db.commit()
+    return borrados
+
+
+def token_valido(token):
+    """¿Es el token de alguna recepción? (comparación en tiempo constante)"""
+    return bool(token) and any(hmac.compare_digest(token, t) for t in TOKENS_RECEPCION)
+
+
+@event.listens_for(database.SessionLocal, "after_flush")
+def _anotar_flush(session, flush_context):
+    """Copia a la bitácora lo que el ORM acaba de escribir"""
+    filas = []
+    for obj in session.new:
+        if type(obj) in MODELOS_SYNC:
+            filas.append((MODELOS_SYNC[type(obj)], obj.id, "guardado"))
+    for obj in session.dirty:
+        if type(obj) in MODELOS_SYNC and session.is_modified(obj, include_collections=False):
+            filas.append((MODELOS_SYNC[type(obj)], obj.id, "guardado"))
+    for obj in session.deleted:
+        if type(obj) in MODELOS_SYNC:
+            filas.append((MODELOS_SYNC[type(obj)], obj.id, "borrado"))
+    if filas:
+        session.connection().execute(
+            insert(models.Cambio),
+            [{"tabla": t, "registro_id": i, "operacion": op} for t, i, op in filas],
+        )
+
+
+def generacion(db):
+    """Generación de la bitácora (sube con cada restauración de un respaldo)"""
+    return db.query(models.VersionCache.version).filter(models.VersionCache.clave == CLAVE_GENERACION).scalar() or 0
+
+
+def _valor_json(valor):
+    """Fechas a ISO; el resto ya es serializable"""
+    return valor.isoformat() if hasattr(valor, "isoformat") else valor
+
+
+def cambios_desde(db, cursor, limite=500):
+    """Lote compacto de filas cambiadas después de `cursor`.
+
+    Devuelve por tabla `{"columnas": [...], "filas": [[...], ...]}` con el
+    estado ACTUAL de cada registro (varios cambios al mismo registro viajan una
+    sola vez), los ids borrados definitivamente y el nuevo cursor.
+    """
+    cambios = (
+        db.query(models.Cambio.id, models.Cambio.tabla, models.Cambio.registro_id)
+        .filter(models.Cambio.id > cursor)
+        .order_by(models.Cambio.id)
+        .limit(limite)
+        .all()
+    )
+
+    ids_por_tabla = {tabla: set() for tabla in MODELOS_SYNC.values()}
+    for _, tabla, registro_id in cambios:
+        ids_por_tabla[tabla].add(registro_id)
+
+    respuesta = {
+        "generacion": generacion(db),
+        "cursor": cambios[-1].id if cambios else cursor,
+        "mas": len(cambios) == limite,
+        "borrados": {},
+    }
+    for modelo, tabla in MODELOS_SYNC.items():
+        columnas = [c.key for c in inspect(modelo).column_attrs]
+        ids = ids_por_tabla[tabla]
+        filas = []
+        if ids:
+            registros = db.query(modelo).filter(modelo.id.in_(ids)).all()
+            filas = [[_valor_json(getattr(r, c)) for c in columnas] for r in registros]
+            encontrados = {r.id for r in registros}
+            if ids - encontrados:
+                respuesta["borrados"][tabla] = sorted(ids - encontrados)
+        respuesta[tabla] = {"columnas": columnas, "filas": filas}
+    return respuesta
@@ -0,0 +1,90 @@
+"""Coherencia de cachés entre workers de uvicorn - sin servicios externos.
+
+Cada escritura incrementa la versión de su clave en la tabla `versiones_cache`
+dentro de la MISMA transacción. Cada worker guarda sus lecturas en memoria y,
+antes de usarlas, consulta `PRAGMA data_version` en una conexión propia: si
+ningún otro proceso ha confirmado cambios el valor no se mueve y la caché se
+usa sin tocar ninguna tabla. Solo cuando cambia se releen las versiones.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+import database
+
+# Entradas por worker: las subclaves vienen de la URL (ej: /api/citas/{doctor_id})
+MAX_ENTRADAS = 256
+
+
+def marcar_cambio(db, *claves):
+    """Incrementa la versión de cada clave (se confirma con el próximo db.commit())"""
+    for clave in claves:
+        db.execute(
+            text(
+                "INSERT INTO versiones_cache (clave, version) VALUES (:clave, 1) "
+                "ON CONFLICT(clave) DO UPDATE SET version = version + 1"
+            ),
+            {"clave": clave},
+        )
+
+
+class CacheCoherente:
+    """Caché en memoria del worker, invalidada por las versiones de la BD"""
+
+    def __init__(self, ruta_bd, max_entradas=MAX_ENTRADAS):
+        self.ruta_bd = ruta_bd
+        self.max_entradas = max_entradas
+        self._conexion = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._versiones = {}  # clave -> versión vista en la BD
+        self._valores = OrderedDict()  # (clave, subclave) -> (versión, valor), LRU
+
+    def _sincronizar(self):
+        """Relee las versiones solo si otra conexión confirmó cambios"""
+        if self._conexion is None:
+            # isolation_level=None: sin transacciones abiertas, data_version siempre fresco
+            self._conexion = sqlite3.connect(
+                self.ruta_bd, check_same_thread=False, isolation_level=None
+            )
+        data_version = self._conexion.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._versiones = dict(
+                self._conexion.execute("SELECT clave, version FROM versiones_cache")
+            )
+            self._data_version = data_version
+            # Lo que quedó viejo ya no se va a servir: no tiene sentido guardarlo
+            for llave in [k for k, (v, _) in self._valores.items()
+                          if v != self._versiones.get(k[0], 0)]:
+                del self._valores[llave]
+
+    def obtener(self, clave, calcular, subclave=None):
+        """Devuelve el valor cacheado de `clave` o lo recalcula con `calcular()`"""
+        with self._lock:
+            self._sincronizar()
+            version = self._versiones.get(clave, 0)
+            guardado = self._valores.get((clave, subclave))
+            if guardado is not None and guardado[0] == version:
+                self._valores.move_to_end((clave, subclave))
+                return guardado[1]
+
+        # Si alguien escribe mientras calculamos, la versión guardada queda
+        # vieja y la próxima lectura recalcula: nunca servimos datos obsoletos
+        valor = calcular()
+        with self._lock:
+            self._valores[(clave, subclave)] = (version, valor)
+            self._valores.move_to_end((clave, subclave))
+            while len(self._valores) > self.max_entradas:
+                self._valores.popitem(last=False)  # La menos usada
+        return valor
+
+    def limpiar(self):
+        """Vacía la caché local del worker"""
+        with self._lock:
+            self._valores.clear()
+
+
+# Instancia única por proceso (cada worker de uvicorn tiene la suya)
+cache = CacheCoherente(database.engine.url.database)
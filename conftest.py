@@ -0,0 +1,8 @@
+"""Las pruebas nunca tocan medicitas.db: antes de importar nada, la BD apunta a un archivo temporal."""
+import os
+import tempfile
+
+os.environ["MEDICITAS_DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='medicitas-pruebas-'), 'medicitas.db')}"
+
+# Script manual (no es una prueba de pytest): modifica medicitas.db al importarse
+collect_ignore = ["test_papelera.py"]
@@ -0,0 +1,137 @@
+"""Construcción de los recursos estáticos (correr al desplegar, no en cada arranque).
+
+Uso:
+    python construir_estaticos.py
+
+1. Descarga UNA vez las librerías (versiones fijas) a static/vendor/ si faltan.
+   Esa carpeta se sube al repositorio: después no hace falta internet.
+2. Genera el CSS de Tailwind solo con las clases usadas en templates/
+   (necesita el CLI: `tailwindcss` en el PATH o Node con `npx`).
+3. Escribe en static/dist/ cada archivo con hash en el nombre, su .gz y su .br
+   (el .br requiere `pip install brotli`), y el manifest.json.
+
+Si falta una librería o el CSS de Tailwind, termina con error y no toca
+static/dist/: nunca deja las páginas en el CDN sin avisar.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+VENDOR = "static/vendor"
+DIST = "static/dist"
+
+# Archivo local -> URL fija (mismas versiones que usaban las plantillas)
+DESCARGAS = {
+    "fullcalendar-6.1.8.js": "https://cdn.jsdelivr.net/npm/fullcalendar@6.1.8/index.global.min.js",
+    "fullcalendar-daygrid-6.1.8.js": "https://cdn.jsdelivr.net/npm/@fullcalendar/daygrid@6.1.8/index.global.min.js",
+    "fullcalendar-timegrid-6.1.8.js": "https://cdn.jsdelivr.net/npm/@fullcalendar/timegrid@6.1.8/index.global.min.js",
+    "fullcalendar-interaction-6.1.8.js": "https://cdn.jsdelivr.net/npm/@fullcalendar/interaction@6.1.8/index.global.min.js",
+    "sweetalert2-11.10.5.js": "https://cdn.jsdelivr.net/npm/sweetalert2@11.10.5/dist/sweetalert2.all.min.js",
+}
+
+# Recurso publicado -> archivos de vendor que lo forman (en orden)
+PAQUETES = {
+    "calendario.js": [
+        "fullcalendar-6.1.8.js",
+        "fullcalendar-daygrid-6.1.8.js",
+        "fullcalendar-timegrid-6.1.8.js",
+        "fullcalendar-interaction-6.1.8.js",
+    ],
+    "sweetalert2.js": ["sweetalert2-11.10.5.js"],
+}
+
+
+def descargar_vendor():
+    os.makedirs(VENDOR, exist_ok=True)
+    for archivo, url in DESCARGAS.items():
+        destino = os.path.join(VENDOR, archivo)
+        if os.path.exists(destino):
+            continue
+        print(f"↓ {url}")
+        try:
+            with urllib.request.urlopen(url, timeout=60) as r:
+                contenido = r.read()
+        except OSError as e:
+            sys.exit(f"✗ No se pudo descargar {url} ({e}).\n"
+                     f"  Copie el archivo a {destino} desde una máquina con internet y súbalo al repositorio.")
+        with open(destino + ".tmp", "wb") as f:
+            f.write(contenido)
+        os.replace(destino + ".tmp", destino)  # Una descarga cortada no queda como si estuviera completa
+
+
+def construir_tailwind():
+    """CSS purgado con el CLI de Tailwind (`tailwindcss` o `npx`); sin CLI termina con error"""
+    argumentos = ["-c", "tailwind.config.js", "-i", "static/src/tailwind.css", "--minify"]
+    if shutil.which("tailwindcss"):
+        comando = ["tailwindcss"] + argumentos
+    elif shutil.which("npx"):
+        comando = [shutil.which("npx"), "--yes", "tailwindcss@3.4.1"] + argumentos
+    else:
+        sys.exit("✗ Tailwind CLI no encontrado: instale `tailwindcss` (v3) en el PATH o Node con `npx`")
+    with tempfile.TemporaryDirectory() as temporal:
+        salida = os.path.join(temporal, "tailwind.css")
+        try:
+            subprocess.run(comando + ["-o", salida], check=True)
+            with open(salida, "rb") as f:
+                contenido = f.read()
+        except (subprocess.CalledProcessError, OSError) as e:
+            sys.exit(f"✗ Falló Tailwind ({e})")
+    if not contenido.strip():
+        sys.exit("✗ Tailwind generó un CSS vacío")
+    return contenido
+
+
+def publicar(directorio, nombre, contenido, manifest):
+    """Escribe nombre.<hash>.ext (+ .gz y .br) en directorio y lo anota en el manifest"""
+    base, extension = os.path.splitext(nombre)
+    final = f"{base}.{hashlib.sha256(contenido).hexdigest()[:10]}{extension}"
+    ruta = os.path.join(directorio, final)
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    with open(ruta + ".gz", "wb") as f:
+        # mtime=0: el mismo contenido produce siempre el mismo .gz
+        f.write(gzip.compress(contenido, compresslevel=9, mtime=0))
+    if brotli:
+        with open(ruta + ".br", "wb") as f:
+            f.write(brotli.compress(contenido, quality=11))
+    manifest[nombre] = final
+    print(f"✓ {nombre} -> {final} ({len(contenido) // 1024} KB)")
+
+
+def main():
+    # Todo lo que puede fallar va antes de tocar static/dist/
+    descargar_vendor()
+    css = construir_tailwind()
+
+    # Se arma al lado y se cambia al final: el servidor nunca ve un dist a medias
+    nuevo = DIST + ".nuevo"
+    shutil.rmtree(nuevo, ignore_errors=True)
+    os.makedirs(nuevo)
+    manifest = {}
+    for nombre, partes in PAQUETES.items():
+        contenido = b"\n;\n".join(open(os.path.join(VENDOR, p), "rb").read() for p in partes)
+        publicar(nuevo, nombre, contenido, manifest)
+    publicar(nuevo, "tailwind.css", css, manifest)
+    if not brotli:
+        print("⚠ Sin módulo brotli: solo se generaron versiones .gz")
+    with open(os.path.join(nuevo, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(DIST, ignore_errors=True)
+    os.replace(nuevo, DIST)
+    print("✓ static/dist/ listo: el servidor lo toma sin reiniciar.")
+
+
+if __name__ == "__main__":
+    main()
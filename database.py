@@ -1,15 +1,27 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # 1. Creamos el archivo de base de datos (100% bajo tu control)
-SQLALCHEMY_DATABASE_URL = "sqlite:///./medicitas.db"
+# MEDICITAS_DB_URL permite usar otra base (ej: las pruebas usan una temporal)
+SQLALCHEMY_DATABASE_URL = os.environ.get("MEDICITAS_DB_URL", "sqlite:///./medicitas.db")
 
 # 2. Configuramos el motor (check_same_thread=False es necesario solo para SQLite)
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 
+# 2.1 Modo WAL: las lecturas del calendario no esperan a quien está agendando
+@event.listens_for(engine, "connect")
+def _configurar_sqlite(conexion, _registro):
+    cursor = conexion.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 # 3. Creamos la sesión (la herramienta para guardar/leer datos)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,239 @@
+"""Detección y fusión de pacientes duplicados.
+
+Comparar todos contra todos es O(n²): imposible con cientos de miles de
+pacientes. En su lugar cada paciente recibe unas pocas "claves de bloque":
+
+- nombre fonético (primer nombre + último apellido, al estilo castellano:
+  b/v, s/z/c, ll/l, h muda...), así "Pérez"/"Peres" y "Villca"/"Vilca"/"Bilca"
+  coinciden
+- celular exacto
+- C.I. sin el último dígito y sin el primero (errores de tipeo en los extremos),
+  junto con la inicial fonética del apellido: con C.I. correlativos (1000000,
+  1000001...) el C.I. solo formaría un bloque de diez por cada decena
+
+Solo se comparan pacientes que comparten al menos una clave, y cada par
+candidato recibe un puntaje entre 0 y 1.
+
+Un duplicado fusionado queda en la papelera con `fusionado_en` apuntando al
+paciente principal: si alguien vuelve a usar su C.I., se atiende al principal.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from sqlalchemy import and_, or_, select, update
+
+import cambios, models, papelera
+from coherencia import marcar_cambio
+
+# Bloques más grandes que esto (ej: un celular compartido por una institución) se
+# parten por otra clave; si aun así no bajan, se omiten y se informan
+MAX_BLOQUE = 50
+
+_REGLAS_FONETICAS = [
+    (re.compile(r"ch"), "X"),
+    (re.compile(r"ll"), "l"),            # Apellidos andinos: Villca/Vilca, Mallku/Malku
+    (re.compile(r"qu"), "k"),
+    (re.compile(r"gu(?=[ei])"), "G"),    # "gui"/"gue": g suave
+    (re.compile(r"c(?=[ei])"), "s"),
+    (re.compile(r"g(?=[ei])"), "j"),
+    (re.compile(r"c"), "k"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"v"), "b"),
+    (re.compile(r"w"), "u"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"(.)\1+"), r"\1"),      # Letras dobles
+    (re.compile(r"(?<=.)[aeiouy]"), ""),  # Vocales (menos la inicial)
+]
+# Memos acotados por palabra: los nombres y apellidos se repiten muchísimo
+_MAX_MEMO = 50000
+
+
+@lru_cache(maxsize=_MAX_MEMO)
+def sin_acentos(palabra):
+    """Palabra en minúsculas, sin acentos ni signos (ej: "Pérez," -> "perez")"""
+    texto = unicodedata.normalize("NFKD", palabra.lower())
+    return "".join(c for c in texto if c.isalpha())
+
+
+@lru_cache(maxsize=_MAX_MEMO)
+def codigo_fonetico(palabra):
+    """Código fonético de una palabra en castellano (ej: "Velásquez" -> "blsks")"""
+    codigo = sin_acentos(palabra)
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        codigo = patron.sub(reemplazo, codigo)
+    return codigo
+
+
+def claves_bloque(ci, nombre, telefono):
+    """Claves con las que se agrupa a un paciente para buscar candidatos"""
+    claves = []
+    palabras = (nombre or "").split()
+    apellido = codigo_fonetico(palabras[-1]) if palabras else ""
+    if palabras:
+        claves.append("n:" + codigo_fonetico(palabras[0]) + "|" + apellido)
+    if telefono:
+        claves.append("t:" + telefono)
+    if ci and len(ci) >= 5:
+        claves.append("c<:" + ci[:-1] + "|" + apellido[:1])
+        claves.append("c>:" + ci[1:] + "|" + apellido[:1])
+    return claves
+
+
+def _subclave(clave, paciente):
+    """Clave para partir un bloque grande: el nombre si es de celular, si no el C.I. sin sus dos últimos dígitos"""
+    ci, nombre = paciente[1] or "", paciente[4] or ""
+    if clave.startswith("t:"):
+        palabras = nombre.split()
+        return codigo_fonetico(palabras[0]) + "|" + codigo_fonetico(palabras[-1]) if palabras else ""
+    return ci[:-2]
+
+
+def nombre_normalizado(nombre):
+    """Nombre sin acentos y con las palabras ordenadas ("Pérez Juan" == "juan perez")"""
+    return " ".join(sorted(sin_acentos(p) for p in (nombre or "").split()))
+
+
+def puntaje(a, b, umbral=0.0):
+    """Similitud de dos pacientes (tuplas id, ci, nombre normalizado, telefono) entre 0 y 1.
+
+    Devuelve 0 en cuanto una cota superior barata muestra que no llega al umbral.
+    """
+    mismo_tel = 0.15 if a[3] and a[3] == b[3] else 0.0
+    comp_ci = SequenceMatcher(None, a[1] or "", b[1] or "")
+    if mismo_tel + 0.45 * comp_ci.quick_ratio() + 0.4 < umbral:
+        return 0.0
+    base = mismo_tel + 0.45 * comp_ci.ratio()
+    comp_nombre = SequenceMatcher(None, a[2], b[2])
+    if base + 0.4 * comp_nombre.quick_ratio() < umbral:
+        return 0.0
+    return round(base + 0.4 * comp_nombre.ratio(), 3)
+
+
+def buscar_candidatos(db, umbral=0.75, limite=200, omitidos=None):
+    """Pares de pacientes activos probablemente duplicados, del más al menos parecido.
+
+    Si se pasa la lista `omitidos`, recibe las claves de los bloques que no se revisaron.
+    """
+    pacientes = {}
+    # Casi todas las claves son de un solo paciente: se guardan como entero y solo
+    # las compartidas reciben una lista. Menos objetos rastreados por el GC, sin apagarlo
+    primero = {}                  # clave -> id del primer paciente
+    otros = defaultdict(list)     # clave compartida -> ids de los demás
+    consulta = select(models.Paciente.id, models.Paciente.ci, models.Paciente.nombre,
+                      models.Paciente.telefono).where(models.Paciente.activo == True)
+
+    filas = db.connection().exec_driver_sql(*_sql_crudo(db, consulta))
+    for id_, ci, nombre, telefono in filas:
+        pacientes[id_] = (id_, ci, nombre_normalizado(nombre), telefono, nombre)
+        for clave in claves_bloque(ci, nombre, telefono):
+            if primero.setdefault(clave, id_) != id_:
+                otros[clave].append(id_)
+
+    bloques = ((clave, [primero[clave]] + resto) for clave, resto in otros.items())
+    pares = pares_candidatos(pacientes, bloques, omitidos)
+    del primero, otros
+
+    candidatos = []
+    for id_a, id_b in pares:
+        p = puntaje(pacientes[id_a], pacientes[id_b], umbral)
+        if p >= umbral:
+            candidatos.append((p, id_a, id_b))
+    candidatos.sort(reverse=True)
+
+    def resumen(fila):
+        return {"id": fila[0], "ci": fila[1], "nombre": fila[4], "telefono": fila[3]}
+
+    return [
+        {"puntaje": p, "a": resumen(pacientes[a]), "b": resumen(pacientes[b])}
+        for p, a, b in candidatos[:limite]
+    ]
+
+
+def pares_candidatos(pacientes, bloques, omitidos=None):
+    """Pares (id_a, id_b) dentro de cada bloque (clave, ids); parte los que pasan de MAX_BLOQUE"""
+    pares = set()
+    for clave, ids in bloques:
+        sub_bloques = [ids]
+        if len(ids) > MAX_BLOQUE:
+            partes = defaultdict(list)
+            for id_ in ids:
+                partes[_subclave(clave, pacientes[id_])].append(id_)
+            sub_bloques = list(partes.values())
+        for ids in sub_bloques:
+            if len(ids) > MAX_BLOQUE:
+                if omitidos is not None and clave not in omitidos[-1:]:
+                    omitidos.append(clave)
+                continue
+            for i, id_a in enumerate(ids):
+                for id_b in ids[i + 1:]:
+                    pares.add((id_a, id_b))
+    return pares
+
+
+def _sql_crudo(db, consulta):
+    """SQL y parámetros de una consulta Core, para leer filas directo del driver"""
+    compilada = consulta.compile(db.get_bind())
+    return str(compilada), tuple(compilada.params[k] for k in compilada.positiontup)
+
+
+def _combinar(textos, por_defecto, separador="\n"):
+    """Une textos de historial sin repetir y sin los valores por defecto"""
+    vistos = []
+    for texto in textos:
+        texto = (texto or "").strip()
+        if texto and texto != por_defecto and texto not in vistos:
+            vistos.append(texto)
+    return separador.join(vistos) if vistos else por_defecto
+
+
+def principal_de(db, paciente):
+    """Sigue `fusionado_en` hasta el paciente que quedó después de las fusiones"""
+    vistos = set()
+    while paciente is not None and paciente.fusionado_en and paciente.id not in vistos:
+        vistos.add(paciente.id)
+        siguiente = db.get(models.Paciente, paciente.fusionado_en)
+        if siguiente is None:
+            break  # El principal fue purgado
+        paciente = siguiente
+    return paciente
+
+
+def fusionar(db, principal_id, duplicados_ids):
+    """Mueve citas e historial de los duplicados al paciente principal.
+
+    No hace commit. Los duplicados quedan en la papelera (inactivos) por si la
+    fusión fue un error. Devuelve el paciente principal o None si no existe.
+    """
+    duplicados_ids = [i for i in duplicados_ids if i != principal_id]
+    principal = db.query(models.Paciente).filter(models.Paciente.id == principal_id).first()
+    if not principal or not duplicados_ids:
+        return principal
+    duplicados = db.query(models.Paciente).filter(models.Paciente.id.in_(duplicados_ids)).all()
+    todos = [principal] + duplicados
+
+    principal.alergias = _combinar([p.alergias for p in todos], "Ninguna conocida")
+    principal.cirugias = _combinar([p.cirugias for p in todos], "Ninguna")
+    principal.notas_medicas = _combinar([p.notas_medicas for p in todos], "", "\n\n")
+    principal.activo = True
+    principal.fusionado_en = None
+
+    # Re-apuntar citas: una sola sentencia para todos los duplicados
+    filtro = models.Cita.paciente_id.in_(duplicados_ids)
+    cambios.registrar_consulta(db, "citas", select(models.Cita.id).where(filtro))
+    db.execute(update(models.Cita).where(filtro).values(paciente_id=principal_id),
+               execution_options={"synchronize_session": False})
+    papelera.desactivar(db, "pacientes", duplicados_ids)
+
+    # Los duplicados (y los que antes se fusionaron en ellos) apuntan al principal
+    redirigir = and_(
+        models.Paciente.id != principal_id,
+        or_(models.Paciente.id.in_(duplicados_ids), models.Paciente.fusionado_en.in_(duplicados_ids)),
+    )
+    cambios.registrar_consulta(db, "pacientes", select(models.Paciente.id).where(redirigir))
+    db.execute(update(models.Paciente).where(redirigir).values(fusionado_en=principal_id),
+               execution_options={"synchronize_session": False})
+    marcar_cambio(db, "citas")
+    return principal
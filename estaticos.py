@@ -0,0 +1,78 @@
+"""Archivos estáticos propios (sin CDN): versionados, precomprimidos y cacheables.
+
+`construir_estaticos.py` deja en static/dist/ cada recurso con un hash en el
+nombre (ej: calendario.3f9a1c2b7e.js) más sus versiones .gz y .br, y un
+manifest.json con el nombre final de cada uno. Como el nombre cambia cuando
+cambia el contenido, el navegador puede guardarlos un año sin preguntar.
+"""
+import json
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+
+DIRECTORIO_DIST = os.path.join("static", "dist")
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+# (mtime del manifest, contenido): se relee cuando el archivo aparece o cambia, así
+# un servidor que arrancó antes de la construcción toma los recursos sin reiniciar
+_manifest = (None, {})
+
+
+def _leer_manifest():
+    global _manifest
+    ruta = os.path.join(DIRECTORIO_DIST, "manifest.json")
+    try:
+        mtime = os.stat(ruta).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime != _manifest[0]:
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                _manifest = (mtime, json.load(f))
+        except FileNotFoundError:
+            _manifest = (None, {})
+        except ValueError:
+            pass  # A medio escribir: se reintenta en la próxima llamada
+    return _manifest[1]
+
+
+def asset(nombre):
+    """URL versionada de un recurso, o None si aún no se corrió la construcción"""
+    final = _leer_manifest().get(nombre)
+    return f"/static/{final}" if final else None
+
+
+class EstaticosPrecomprimidos(StaticFiles):
+    """StaticFiles que entrega el .br o .gz ya comprimido si el navegador lo acepta"""
+
+    async def check_config(self):
+        """Sin static/dist (aún no se construyó) cada recurso responde 404, no un error 500"""
+        if self.directory is not None and not os.path.isdir(self.directory):
+            return
+        await super().check_config()
+
+    async def get_response(self, path, scope):
+        aceptadas = Headers(scope=scope).get("accept-encoding", "")
+        respuesta = None
+        for codificacion, extension in (("br", ".br"), ("gzip", ".gz")):
+            if codificacion not in aceptadas:
+                continue
+            try:
+                respuesta = await super().get_response(path + extension, scope)
+            except HTTPException:
+                continue
+            respuesta.headers["content-encoding"] = codificacion
+            tipo = mimetypes.guess_type(path)[0]
+            if tipo:
+                respuesta.headers["content-type"] = tipo + ("; charset=utf-8" if tipo.startswith("text/") else "")
+            break
+        if respuesta is None:
+            respuesta = await super().get_response(path, scope)
+
+        if respuesta.status_code in (200, 304):
+            respuesta.headers["cache-control"] = CACHE_INMUTABLE
+            respuesta.headers["vary"] = "Accept-Encoding"
+        return respuesta
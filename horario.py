@@ -0,0 +1,57 @@
+"""Fechas de las citas: minutos epoch (UTC) para comparar, hora local para mostrar.
+
+Las citas guardan dos formas del mismo instante:
+- `inicio_min` / `fin_min`: minutos desde 1970-01-01 UTC (enteros indexados).
+  Todos los choques y rangos se comparan aquí, sin importar el offset con el
+  que llegó la fecha.
+- `fecha_inicio` / `fecha_fin`: hora de pared en la zona del consultorio
+  (`Configuracion.zona_horaria`), sin tzinfo, para plantillas y calendario.
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+ZONA_POR_DEFECTO = "America/La_Paz"
+# Ninguna cita dura más que esto. Así una cita que solapa [desde, hasta) empieza
+# después de desde - MAX_DURACION_MIN y el índice (doctor_id, inicio_min) se
+# recorre solo en ese rango acotado, no en todo el historial del doctor.
+MAX_DURACION_MIN = 24 * 60
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def zona(nombre):
+    """ZoneInfo del consultorio (si el nombre no existe, la zona por defecto)"""
+    try:
+        return ZoneInfo(nombre or ZONA_POR_DEFECTO)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(ZONA_POR_DEFECTO)
+
+
+def zona_valida(nombre):
+    try:
+        ZoneInfo(nombre)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def a_minutos(fecha, tz):
+    """datetime (con o sin tzinfo; sin tzinfo = hora local de `tz`) -> minutos epoch UTC"""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=tz)
+    return int((fecha - _EPOCH).total_seconds() // 60)
+
+
+def a_local(minutos, tz):
+    """Minutos epoch UTC -> hora de pared en `tz`, sin tzinfo"""
+    return (_EPOCH + timedelta(minutes=minutos)).astimezone(tz).replace(tzinfo=None)
+
+
+def normalizar(texto, tz):
+    """Texto ISO del formulario -> (hora local sin tzinfo, minutos epoch UTC)
+
+    Acepta "2025-03-10T09:00:00" (hora del consultorio) y también fechas con
+    offset o con "Z", que se convierten a la zona del consultorio.
+    """
+    fecha = datetime.fromisoformat(texto.replace('Z', '+00:00'))
+    minutos = a_minutos(fecha, tz)
+    return a_local(minutos, tz), minutos
@@ -1,24 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form
+from fastapi import FastAPI, Depends, HTTPException, Request, Form, Header
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session, joinedload
+from datetime import date, datetime, timedelta
 from typing import Optional, List
 import re
-import database, models
+import database, models, cambios, admision, papelera, horario, migraciones, duplicados, estaticos, respaldo
+from coherencia import cache, marcar_cambio
 
 # --- CONFIGURACIÓN INICIAL ---
 # Creamos las tablas en la BD automáticamente al iniciar
 models.Base.metadata.create_all(bind=database.engine)
+# Columnas e índices nuevos en BDs que ya existían (ver migraciones.py)
+migraciones.aplicar(database.engine)
 
 app = FastAPI(title="Sistema Integral MediCitas")
 
 # MIDDLEWARE DE SESIONES PARA LOGIN
 app.add_middleware(SessionMiddleware, secret_key="medicitas_secret_key_2025_seguro")
 
+# ARCHIVOS ESTÁTICOS PROPIOS: versionados, precomprimidos y con caché de un año (ver estaticos.py)
+app.mount("/static", estaticos.EstaticosPrecomprimidos(directory=estaticos.DIRECTORIO_DIST, check_dir=False), name="static")
+
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset"] = estaticos.asset
+
+# CONTROL DE ADMISIÓN: cola llena -> 429 inmediato (ver admision.py)
+@app.exception_handler(admision.Saturado)
+async def cola_saturada(request: Request, exc: admision.Saturado):
+    return JSONResponse(
+        content={"status": "error", "msg": "Sistema ocupado, intente de nuevo en unos segundos"},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # Dependencia para obtener la sesión de BD en cada petición
 def get_db():
@@ -28,6 +44,38 @@ def get_db():
     finally:
         db.close()
 
+# --- LECTURAS CACHEADAS POR WORKER (ver coherencia.py) ---
+def _como_dict(obj):
+    """Copia las columnas de un modelo a un dict (seguro de compartir entre peticiones)"""
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+def _cargar_config(db: Session):
+    """Configuración global (la crea con valores por defecto si no existe)"""
+    config = db.query(models.Configuracion).first()
+    if not config:
+        config = models.Configuracion()  # Defaults
+        db.add(config)
+        marcar_cambio(db, "config")
+        db.commit()
+        db.refresh(config)
+    return _como_dict(config)
+
+def _cargar_doctores_activos(db: Session):
+    """Doctores activos (si no hay ninguno, creamos algunos de prueba)"""
+    doctores = db.query(models.Doctor).filter(models.Doctor.activo == True).all()
+    if not doctores:
+        doctores_prueba = [
+            models.Doctor(nombre="Dr. Juan Pérez", especialidad="Medicina General", duracion_cita=30),
+            models.Doctor(nombre="Dra. María López", especialidad="Cardiología", duracion_cita=45),
+            models.Doctor(nombre="Dr. Carlos Rodríguez", especialidad="Pediatría", duracion_cita=30),
+        ]
+        for doc in doctores_prueba:
+            db.add(doc)
+        marcar_cambio(db, "doctores")
+        db.commit()
+        doctores = db.query(models.Doctor).filter(models.Doctor.activo == True).all()
+    return [_como_dict(d) for d in doctores]
+
 # --- FUNCIONES DE AUTENTICACIÓN ---
 def verificar_sesion(request: Request):
     """Verifica si el usuario está logueado"""
@@ -36,7 +84,7 @@ def verificar_sesion(request: Request):
 # --- EVENTO DE INICIO: CREAR ADMIN POR DEFECTO ---
 @app.on_event("startup")
 def startup_event():
-    """Crea el usuario admin/admin si no existe"""
+    """Crea el usuario admin/admin si no existe, prepara la bitácora y los respaldos"""
     db = database.SessionLocal()
     try:
         admin = db.query(models.Admin).first()
@@ -44,8 +92,18 @@ def startup_event():
             db.add(models.Admin(username="admin", password="admin"))
             db.commit()
             print("✓ Usuario admin creado: admin/admin")
+        # Registros anteriores a la bitácora de cambios (para /api/sync)
+        cambios.sembrar_bitacora(db)
+        # Un solo cambio por registro: una resincronización completa no recorre todo el historial
+        compactados = cambios.compactar(db)
+        if compactados:
+            print(f"✓ Bitácora compactada: {compactados} cambios repetidos eliminados")
     finally:
         db.close()
+    if not estaticos.asset("calendario.js"):
+        print("⚠ Recursos estáticos sin construir: las páginas usan el CDN (python construir_estaticos.py)")
+    # Respaldos automáticos en caliente (ver respaldo.py)
+    respaldo.iniciar_programador()
 
 # --- 1. LANDING PAGE (La Entrada) ---
 @app.get("/", response_class=HTMLResponse)
@@ -87,30 +145,12 @@ async def logout(request: Request):
     return RedirectResponse(url="/login", status_code=303)
 
 # --- 3. MEDICITAS (Lado Público/Recepción) ---
-@app.get("/medicitas", response_class=HTMLResponse)
-async def public_calendar(request: Request, db: Session = Depends(get_db)):
+@app.get("/medicitas", response_class=HTMLResponse, dependencies=[Depends(admision.lectura("/medicitas"))])
+def public_calendar(request: Request, db: Session = Depends(get_db)):
     """Calendario interactivo para recepción de pacientes"""
-    # Obtener configuración
-    config = db.query(models.Configuracion).first()
-    if not config:
-        config = models.Configuracion()  # Defaults
-        db.add(config)
-        db.commit()
-        db.refresh(config)
-    
-    doctores = db.query(models.Doctor).filter(models.Doctor.activo == True).all()
-    
-    # Si no hay doctores, creamos algunos de prueba
-    if not doctores:
-        doctores_prueba = [
-            models.Doctor(nombre="Dr. Juan Pérez", especialidad="Medicina General", duracion_cita=30),
-            models.Doctor(nombre="Dra. María López", especialidad="Cardiología", duracion_cita=45),
-            models.Doctor(nombre="Dr. Carlos Rodríguez", especialidad="Pediatría", duracion_cita=30),
-        ]
-        for doc in doctores_prueba:
-            db.add(doc)
-        db.commit()
-        doctores = db.query(models.Doctor).filter(models.Doctor.activo == True).all()
+    # Configuración y doctores salen de la caché del worker (coherente entre procesos)
+    config = cache.obtener("config", lambda: _cargar_config(db))
+    doctores = cache.obtener("doctores", lambda: _cargar_doctores_activos(db))
     
     # Verificamos si es admin para mostrar el botón de "Volver al Panel"
     es_admin = verificar_sesion(request)
@@ -136,6 +176,7 @@ async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
     if not config:
         config = models.Configuracion()
         db.add(config)
+        marcar_cambio(db, "config")
         db.commit()
         db.refresh(config)
     
@@ -213,9 +254,12 @@ async def update_config(
     hora_apertura: str = Form(...),
     hora_cierre: str = Form(...),
     dias: List[str] = Form([]),  # Recibe lista de checkboxes (ej: ["1", "2", "3"])
+    zona_horaria: Optional[str] = Form(None),  # Si no llega, se mantiene la zona actual
     db: Session = Depends(get_db)
 ):
     """Actualizar configuración global del consultorio"""
+    if zona_horaria and not horario.zona_valida(zona_horaria):
+        return JSONResponse({"status": "error", "msg": f"Zona horaria inválida: {zona_horaria}"}, status_code=400)
     config = db.query(models.Configuracion).first()
     if not config:
         config = models.Configuracion()
@@ -224,6 +268,16 @@ async def update_config(
     config.hora_apertura = hora_apertura
     config.hora_cierre = hora_cierre
     config.dias_laborales = ",".join(dias)  # Guardamos como "1,2,3"
+    
+    # Cambio de zona: los instantes (minutos epoch) no cambian, solo la hora local mostrada
+    if zona_horaria and zona_horaria != config.zona_horaria:
+        config.zona_horaria = zona_horaria
+        tz = horario.zona(zona_horaria)
+        for cita in db.query(models.Cita).filter(models.Cita.inicio_min != None):
+            cita.fecha_inicio = horario.a_local(cita.inicio_min, tz)
+            cita.fecha_fin = horario.a_local(cita.fin_min, tz)
+        marcar_cambio(db, "citas")
+    marcar_cambio(db, "config")
     db.commit()
     return RedirectResponse(url="/admin", status_code=303)
 
@@ -255,6 +309,7 @@ async def guardar_doctor(
             doc.correo = correo
             doc.hora_entrada = hora_entrada if hora_entrada else None
             doc.hora_salida = hora_salida if hora_salida else None
+            marcar_cambio(db, "doctores")
             db.commit()
     else:
         # Crear nuevo doctor
@@ -269,16 +324,14 @@ async def guardar_doctor(
             hora_salida=hora_salida if hora_salida else None
         )
         db.add(nuevo)
+        marcar_cambio(db, "doctores")
         db.commit()
     return RedirectResponse(url="/admin", status_code=303)
 
 @app.post("/admin/doctor/borrar")
 async def borrar_doctor(doc_id: int = Form(...), db: Session = Depends(get_db)):
-    """Soft delete: Marcar doctor como inactivo"""
-    doc = db.query(models.Doctor).filter(models.Doctor.id == doc_id).first()
-    if doc:
-        # Soft delete: marcar como inactivo
-        doc.activo = False
+    """Soft delete: Marcar doctor (y sus citas) como inactivo"""
+    if papelera.desactivar(db, "doctores", [doc_id]):
         db.commit()
         return JSONResponse({"status": "ok"})
     return JSONResponse({"status": "error", "msg": "Doctor no encontrado"}, status_code=404)
@@ -318,6 +371,7 @@ async def guardar_paciente(
         pac.alergias = alergias if alergias else "Ninguna conocida"
         pac.cirugias = cirugias if cirugias else "Ninguna"
         pac.notas_medicas = notas
+        marcar_cambio(db, "citas")  # Los eventos del calendario llevan datos del paciente
         db.commit()
         return RedirectResponse(url="/admin", status_code=303)
     return JSONResponse({"status": "error", "msg": "Paciente no encontrado"}, status_code=404)
@@ -359,18 +413,44 @@ async def crear_paciente_admin(
     db.commit()
     return RedirectResponse(url="/admin", status_code=303)
 
+# --- DUPLICADOS: BÚSQUEDA Y FUSIÓN DE PACIENTES (ver duplicados.py) ---
+@app.get("/admin/duplicados")
+def buscar_duplicados(request: Request, umbral: float = 0.75, limite: int = 200, db: Session = Depends(get_db)):
+    """Pares de pacientes probablemente duplicados (CI con errores, variantes del nombre)"""
+    if not verificar_sesion(request):
+        return JSONResponse({"status": "error", "msg": "Sesión expirada"}, status_code=401)
+    omitidos = []
+    candidatos = duplicados.buscar_candidatos(db, umbral, limite, omitidos)
+    # Bloques demasiado grandes aun partidos (ej: un celular de institución): no se revisaron
+    return JSONResponse(candidatos, headers={"X-Bloques-Omitidos": str(len(omitidos))})
+
+@app.post("/admin/paciente/fusionar")
+def fusionar_pacientes(
+    request: Request,
+    principal_id: int = Form(...),
+    duplicados_ids: List[int] = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Pasar citas e historial de los duplicados al paciente principal (una transacción)"""
+    if not verificar_sesion(request):
+        return JSONResponse({"status": "error", "msg": "Sesión expirada"}, status_code=401)
+    principal = duplicados.fusionar(db, principal_id, duplicados_ids)
+    if not principal:
+        return JSONResponse({"status": "error", "msg": "Paciente no encontrado"}, status_code=404)
+    db.commit()
+    return JSONResponse({"status": "ok", "msg": f"Pacientes fusionados en {principal.nombre}"})
+
 # --- NUEVA API: BÚSQUEDA DE PACIENTE POR CI ---
-@app.get("/api/paciente/{ci}")
-async def get_paciente(ci: str, db: Session = Depends(get_db)):
+@app.get("/api/paciente/{ci}", dependencies=[Depends(admision.lectura("/api/paciente"))])
+def get_paciente(ci: str, db: Session = Depends(get_db)):
     """API para buscar paciente por CI (autocompletado en agenda)"""
-    p = db.query(models.Paciente).filter(
-        models.Paciente.ci == ci, 
-        models.Paciente.activo == True
-    ).first()
+    # Un duplicado fusionado responde con los datos de su paciente principal
+    p = duplicados.principal_de(db, db.query(models.Paciente).filter(models.Paciente.ci == ci).first())
     
-    if p:
+    if p and p.activo:
         return JSONResponse({
             "encontrado": True,
+            "ci": p.ci,
             "nombre": p.nombre,
             "telefono": p.telefono,
             "alergias": p.alergias,
@@ -384,13 +464,8 @@ async def get_paciente(ci: str, db: Session = Depends(get_db)):
 async def borrar_paciente(pac_id: int = Form(...), db: Session = Depends(get_db)):
     """Soft delete: Marcar paciente como inactivo en lugar de eliminarlo"""
     print(f"🔴 BORRAR PACIENTE - ID recibido: {pac_id}")
-    pac = db.query(models.Paciente).filter(models.Paciente.id == pac_id).first()
-    if pac:
-        print(f"🔴 Paciente encontrado: {pac.nombre} (CI: {pac.ci})")
-        # Soft delete: marcar como inactivo
-        pac.activo = False
-        # También desactivar sus citas
-        db.query(models.Cita).filter(models.Cita.paciente_id == pac_id).update({"activo": False})
+    # Soft delete: marcar como inactivo (también desactiva sus citas)
+    if papelera.desactivar(db, "pacientes", [pac_id]):
         db.commit()
         print(f"✅ Paciente {pac_id} marcado como inactivo")
         return JSONResponse({"status": "ok"})
@@ -400,9 +475,7 @@ async def borrar_paciente(pac_id: int = Form(...), db: Session = Depends(get_db)
 @app.post("/admin/paciente/restaurar")
 async def restaurar_paciente(pac_id: int = Form(...), db: Session = Depends(get_db)):
     """Restaurar paciente inactivo"""
-    pac = db.query(models.Paciente).filter(models.Paciente.id == pac_id).first()
-    if pac:
-        pac.activo = True
+    if papelera.restaurar(db, "pacientes", [pac_id]):
         db.commit()
         return JSONResponse({"status": "ok"})
     return JSONResponse({"status": "error", "msg": "Paciente no encontrado"}, status_code=404)
@@ -410,9 +483,7 @@ async def restaurar_paciente(pac_id: int = Form(...), db: Session = Depends(get_
 @app.post("/admin/doctor/restaurar")
 async def restaurar_doctor(doc_id: int = Form(...), db: Session = Depends(get_db)):
     """Restaurar doctor inactivo"""
-    doc = db.query(models.Doctor).filter(models.Doctor.id == doc_id).first()
-    if doc:
-        doc.activo = True
+    if papelera.restaurar(db, "doctores", [doc_id]):
         db.commit()
         return JSONResponse({"status": "ok"})
     return JSONResponse({"status": "error", "msg": "Doctor no encontrado"}, status_code=404)
@@ -420,56 +491,79 @@ async def restaurar_doctor(doc_id: int = Form(...), db: Session = Depends(get_db
 @app.post("/admin/cita/restaurar")
 async def restaurar_cita(cita_id: int = Form(...), db: Session = Depends(get_db)):
     """Restaurar cita inactiva"""
-    cita = db.query(models.Cita).filter(models.Cita.id == cita_id).first()
-    if cita:
-        cita.activo = True
+    if papelera.restaurar(db, "citas", [cita_id]):
         db.commit()
         return JSONResponse({"status": "ok"})
     return JSONResponse({"status": "error", "msg": "Cita no encontrada"}, status_code=404)
 
+# API: Papelera por lotes (una sentencia por tabla, una sola transacción)
+@app.post("/admin/papelera/lote")
+async def papelera_lote(
+    request: Request,
+    tabla: str = Form(...),   # "doctores", "pacientes" o "citas"
+    accion: str = Form(...),  # "desactivar", "restaurar" o "purgar"
+    ids: List[int] = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Restaurar, dar de baja o borrar definitivamente muchos registros a la vez"""
+    if not verificar_sesion(request):
+        return JSONResponse({"status": "error", "msg": "Sesión expirada"}, status_code=401)
+    if tabla not in papelera.MODELOS or accion not in papelera.ACCIONES:
+        return JSONResponse({"status": "error", "msg": "Tabla o acción no válida"}, status_code=400)
+    
+    afectados = papelera.ACCIONES[accion](db, tabla, ids)
+    db.commit()
+    return JSONResponse({"status": "ok", "afectados": afectados})
+
 # --- APIS EXISTENTES (Sin cambios mayores) ---
 
-@app.get("/api/citas/{doctor_id}")
-async def obtener_citas(doctor_id: int, db: Session = Depends(get_db)):
+def _cargar_eventos(db: Session, doctor_id: int):
+    """Eventos de FullCalendar para las citas activas de un doctor"""
+    # joinedload: el paciente viene en la misma consulta (sin una consulta extra por cita)
+    citas = db.query(models.Cita).options(joinedload(models.Cita.paciente)).filter(
+        models.Cita.doctor_id == doctor_id, 
+        models.Cita.activo == True
+    ).all()
+    
+    eventos = []
+    for cita in citas:
+        try:
+            # Protección: Verificar que el paciente existe
+            ci_paciente = ""
+            nombre_paciente = "Sin Datos"
+            
+            if cita.paciente:
+                ci_paciente = str(cita.paciente.ci) if cita.paciente.ci else ""
+                nombre_paciente = str(cita.paciente.nombre) if cita.paciente.nombre else "Sin Nombre"
+            
+            eventos.append({
+                "id": str(cita.id),
+                "title": "Ocupado",
+                "start": cita.fecha_inicio.isoformat(),
+                "end": cita.fecha_fin.isoformat(),
+                "color": "#ef4444",
+                "extendedProps": {
+                    "cita_id": cita.id,
+                    "ci": ci_paciente,
+                    "nombre": nombre_paciente,
+                    "telefono": str(cita.paciente.telefono) if cita.paciente and cita.paciente.telefono else "",
+                    "motivo": str(cita.motivo) if cita.motivo else "",
+                    # Datos del historial médico
+                    "alergias": str(cita.paciente.alergias) if cita.paciente and cita.paciente.alergias else "Ninguna conocida",
+                    "cirugias": str(cita.paciente.cirugias) if cita.paciente and cita.paciente.cirugias else "Ninguna",
+                    "notas": str(cita.paciente.notas_medicas) if cita.paciente and cita.paciente.notas_medicas else ""
+                }
+            })
+        except Exception as e:
+            print(f"Error procesando cita {cita.id}: {e}")
+            continue
+    return eventos
+
+@app.get("/api/citas/{doctor_id}", dependencies=[Depends(admision.lectura("/api/citas"))])
+def obtener_citas(doctor_id: int, db: Session = Depends(get_db)):
     """API que devuelve las citas para pintar el calendario"""
     try:
-        citas = db.query(models.Cita).filter(
-            models.Cita.doctor_id == doctor_id, 
-            models.Cita.activo == True
-        ).all()
-        
-        eventos = []
-        for cita in citas:
-            try:
-                # Protección: Verificar que el paciente existe
-                ci_paciente = ""
-                nombre_paciente = "Sin Datos"
-                
-                if cita.paciente:
-                    ci_paciente = str(cita.paciente.ci) if cita.paciente.ci else ""
-                    nombre_paciente = str(cita.paciente.nombre) if cita.paciente.nombre else "Sin Nombre"
-                
-                eventos.append({
-                    "id": str(cita.id),
-                    "title": "Ocupado",
-                    "start": cita.fecha_inicio.isoformat(),
-                    "end": cita.fecha_fin.isoformat(),
-                    "color": "#ef4444",
-                    "extendedProps": {
-                        "cita_id": cita.id,
-                        "ci": ci_paciente,
-                        "nombre": nombre_paciente,
-                        "telefono": str(cita.paciente.telefono) if cita.paciente and cita.paciente.telefono else "",
-                        "motivo": str(cita.motivo) if cita.motivo else "",
-                        # Datos del historial médico
-                        "alergias": str(cita.paciente.alergias) if cita.paciente and cita.paciente.alergias else "Ninguna conocida",
-                        "cirugias": str(cita.paciente.cirugias) if cita.paciente and cita.paciente.cirugias else "Ninguna",
-                        "notas": str(cita.paciente.notas_medicas) if cita.paciente and cita.paciente.notas_medicas else ""
-                    }
-                })
-            except Exception as e:
-                print(f"Error procesando cita {cita.id}: {e}")
-                continue
+        eventos = cache.obtener("citas", lambda: _cargar_eventos(db, doctor_id), subclave=doctor_id)
         
         print(f"✓ Devolviendo {len(eventos)} citas para doctor {doctor_id}")
         return eventos
@@ -477,17 +571,93 @@ async def obtener_citas(doctor_id: int, db: Session = Depends(get_db)):
         print(f"✗ Error en obtener_citas: {e}")
         return []
 
+# API: Agenda de TODA la clínica (todos los doctores activos en una sola consulta)
+@app.get("/api/agenda", dependencies=[Depends(admision.lectura("/api/agenda"))])
+def agenda_clinica(fecha: Optional[str] = None, dias: int = 1, db: Session = Depends(get_db)):
+    """Citas y horarios de todos los doctores activos, agrupados por doctor en columnas"""
+    config = cache.obtener("config", lambda: _cargar_config(db))
+    tz = horario.zona(config["zona_horaria"])
+    try:
+        dia = date.fromisoformat(fecha) if fecha else datetime.now(tz).date()
+    except ValueError:
+        return JSONResponse(content={"status": "error", "msg": "Formato de fecha inválido (AAAA-MM-DD)"}, status_code=400)
+    desde = datetime.combine(dia, datetime.min.time())
+    hasta = desde + timedelta(days=max(1, min(dias, 31)))
+    desde_min, hasta_min = horario.a_minutos(desde, tz), horario.a_minutos(hasta, tz)
+
+    # LEFT JOIN: los doctores sin citas en la ventana también aparecen (con columnas vacías)
+    # La ventana va en el ON (en minutos epoch) para que use el índice ix_citas_doctor_inicio
+    Cita, Doctor, Paciente = models.Cita, models.Doctor, models.Paciente
+    consulta = (
+        select(
+            Doctor.id, Doctor.nombre, Doctor.especialidad, Doctor.duracion_cita,
+            Doctor.hora_entrada, Doctor.hora_salida,
+            Cita.id, Cita.fecha_inicio, Cita.fecha_fin, Cita.motivo,
+            Paciente.ci, Paciente.nombre,
+        )
+        .select_from(Doctor)
+        .outerjoin(Cita, and_(
+            Cita.doctor_id == Doctor.id,
+            Cita.activo == True,
+            Cita.inicio_min < hasta_min,
+            Cita.inicio_min > desde_min - horario.MAX_DURACION_MIN,  # Cota inferior para el índice
+            Cita.fin_min > desde_min,
+        ))
+        .outerjoin(Paciente, Paciente.id == Cita.paciente_id)
+        .where(Doctor.activo == True)
+        .order_by(Doctor.id, Cita.inicio_min)
+    )
+
+    dias_laborales = [int(d) for d in config["dias_laborales"].split(",") if d]
+    doctores = {}
+    for (doc_id, nombre, especialidad, duracion, entrada, salida,
+         cita_id, inicio, fin, motivo, ci, paciente) in db.execute(consulta):
+        doc = doctores.get(doc_id)
+        if doc is None:
+            doc = doctores[doc_id] = {
+                # id/title/businessHours: formato de "resources" de FullCalendar
+                "id": str(doc_id),
+                "title": nombre,
+                "especialidad": especialidad,
+                "duracion_cita": duracion,
+                "businessHours": {
+                    "startTime": entrada or config["hora_apertura"],
+                    "endTime": salida or config["hora_cierre"],
+                    "daysOfWeek": dias_laborales,
+                },
+                "citas": {"id": [], "inicio": [], "fin": [], "ci": [], "paciente": [], "motivo": []},
+            }
+        if cita_id is not None:
+            citas = doc["citas"]
+            citas["id"].append(cita_id)
+            citas["inicio"].append(inicio.isoformat())
+            citas["fin"].append(fin.isoformat())
+            citas["ci"].append(ci or "")
+            citas["paciente"].append(paciente or "Sin Datos")
+            citas["motivo"].append(motivo or "")
+
+    return {
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "doctores": list(doctores.values()),
+    }
+
 # API: Buscar Paciente por CI Exacto (Para autocompletado en formulario)
-@app.get("/api/buscar-paciente")
-async def buscar_paciente(q: str, db: Session = Depends(get_db)):
-    """API para búsqueda predictiva de pacientes por CI (solo activos)"""
+@app.get("/api/buscar-paciente", dependencies=[Depends(admision.lectura("/api/buscar-paciente"))])
+def buscar_paciente(q: str, db: Session = Depends(get_db)):
+    """API para búsqueda predictiva de pacientes por CI (solo activos; los fusionados, como su principal)"""
     pacientes = db.query(models.Paciente).filter(
         models.Paciente.ci.like(f"{q}%"),
-        models.Paciente.activo == True
+        (models.Paciente.activo == True) | (models.Paciente.fusionado_en != None)
     ).limit(5).all()
     
     resultados = []
+    vistos = set()
     for p in pacientes:
+        p = duplicados.principal_de(db, p)
+        if not p.activo or p.id in vistos:
+            continue
+        vistos.add(p.id)
         resultados.append({
             "id": p.id,
             "ci": p.ci,
@@ -496,8 +666,24 @@ async def buscar_paciente(q: str, db: Session = Depends(get_db)):
         })
     return resultados
 
-@app.post("/agendar")
-async def agendar_cita(
+# API: Sincronización delta para recepciones (caché local en cada PC)
+@app.get("/api/sync", dependencies=[Depends(admision.lectura("/api/sync", concurrencia=4))])
+def sincronizar(
+    request: Request,
+    since: int = 0,
+    limite: int = 500,
+    x_token_recepcion: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Devuelve solo los doctores/pacientes/citas que cambiaron después del cursor `since`"""
+    # Lleva historiales clínicos: solo admin o recepciones con token (ver cambios.py)
+    if not (verificar_sesion(request) or cambios.token_valido(x_token_recepcion)):
+        return JSONResponse({"status": "error", "msg": "No autorizado"}, status_code=401)
+    limite = max(1, min(limite, 2000))
+    return cambios.cambios_desde(db, since, limite)
+
+@app.post("/agendar", dependencies=[Depends(admision.admitir_escritura)])
+def agendar_cita(
     cita_id: Optional[int] = Form(None),
     doctor_id: int = Form(...),
     fecha_inicio_str: str = Form(...),
@@ -532,19 +718,26 @@ async def agendar_cita(
             status_code=400
         )
     
-    # 2. Convertir fechas
+    # 2. Convertir fechas: hora local del consultorio + minutos epoch UTC (ver horario.py)
+    tz = horario.zona(cache.obtener("config", lambda: _cargar_config(db))["zona_horaria"])
     try:
-        fecha_inicio = datetime.fromisoformat(fecha_inicio_str.replace('Z', '+00:00'))
-        fecha_fin = datetime.fromisoformat(fecha_fin_str.replace('Z', '+00:00'))
+        fecha_inicio, inicio_min = horario.normalizar(fecha_inicio_str, tz)
+        fecha_fin, fin_min = horario.normalizar(fecha_fin_str, tz)
     except ValueError:
         return JSONResponse(content={"status": "error", "msg": "Formato de fecha inválido"}, status_code=400)
+    if fin_min <= inicio_min:
+        return JSONResponse(content={"status": "error", "msg": "La hora de fin debe ser posterior al inicio"}, status_code=400)
+    if fin_min - inicio_min > horario.MAX_DURACION_MIN:
+        return JSONResponse(content={"status": "error", "msg": "Una cita no puede durar más de 24 horas"}, status_code=400)
 
     # 3. VALIDACIÓN: ¿Hay choque de horario? (Excluyendo la cita actual si es edición)
+    # Comparación entera sobre el índice ix_citas_doctor_inicio, en un rango acotado por ambos lados
     query_choque = db.query(models.Cita).filter(
         models.Cita.doctor_id == doctor_id,
         models.Cita.activo == True,
-        models.Cita.fecha_inicio < fecha_fin,
-        models.Cita.fecha_fin > fecha_inicio
+        models.Cita.inicio_min < fin_min,
+        models.Cita.inicio_min > inicio_min - horario.MAX_DURACION_MIN,
+        models.Cita.fin_min > inicio_min
     )
     if cita_id:
         query_choque = query_choque.filter(models.Cita.id != cita_id)
@@ -553,7 +746,8 @@ async def agendar_cita(
         return JSONResponse(content={"status": "error", "msg": "⛔ HORARIO OCUPADO"}, status_code=400)
 
     # 4. Gestionar Paciente (Buscar o Crear) + Guardar Historial Médico
-    paciente = db.query(models.Paciente).filter(models.Paciente.ci == paciente_ci).first()
+    # Si el CI es de un duplicado ya fusionado, la cita va al paciente principal
+    paciente = duplicados.principal_de(db, db.query(models.Paciente).filter(models.Paciente.ci == paciente_ci).first())
     if not paciente:
         # No existe: Crear nuevo paciente con historial
         paciente = models.Paciente(
@@ -577,6 +771,7 @@ async def agendar_cita(
         # Reactivar si estaba inactivo
         if not paciente.activo:
             paciente.activo = True
+        marcar_cambio(db, "citas")  # Los eventos del calendario llevan datos del paciente
         db.commit()
 
     if cita_id:
@@ -586,6 +781,8 @@ async def agendar_cita(
             return JSONResponse(content={"status": "error", "msg": "Cita no encontrada"}, status_code=404)
         cita.fecha_inicio = fecha_inicio
         cita.fecha_fin = fecha_fin
+        cita.inicio_min = inicio_min
+        cita.fin_min = fin_min
         cita.motivo = motivo
         cita.paciente_id = paciente.id  # CLAVE: Vincular correctamente al paciente
         mensaje = "✅ Cita actualizada correctamente"
@@ -596,12 +793,15 @@ async def agendar_cita(
             paciente_id=paciente.id,  # CLAVE: Vincular correctamente al paciente
             fecha_inicio=fecha_inicio,
             fecha_fin=fecha_fin,
+            inicio_min=inicio_min,
+            fin_min=fin_min,
             motivo=motivo
         )
         db.add(nueva_cita)
         mensaje = "✅ Cita agendada con éxito"
     
     print(f"🟢 Guardando cita en BD...")
+    marcar_cambio(db, "citas")
     db.commit()
     print(f"✅ Cita guardada exitosamente. Paciente ID: {paciente.id}, Cita modo: {'edición' if cita_id else 'nueva'}")
     return JSONResponse(content={"status": "ok", "msg": mensaje})
@@ -643,6 +843,7 @@ async def borrar_cita(request: Request, db: Session = Depends(get_db)):
     if cita:
         # Soft delete: marcar como inactivo en lugar de eliminar
         cita.activo = False
+        marcar_cambio(db, "citas")
         db.commit()
         print(f"--> [BORRAR] ✓ Cita {cita_id} marcada como inactiva")
         return JSONResponse(content={"status": "ok", "msg": "Eliminado"})
@@ -661,9 +862,15 @@ async def cancelar_cita(cita_id: int, db: Session = Depends(get_db)):
         )
     
     cita.activo = False
+    marcar_cambio(db, "citas")
     db.commit()
     return JSONResponse(content={"status": "ok", "msg": "Cita cancelada"})
 
+@app.get("/api/admision")
+async def metricas_admision():
+    """Profundidad de las colas de admisión de este worker"""
+    return admision.metricas()
+
 @app.get("/api/estadisticas")
 async def estadisticas(db: Session = Depends(get_db)):
     """Dashboard simple con estadísticas"""
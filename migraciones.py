@@ -0,0 +1,86 @@
+"""Migraciones ligeras de la BD (SQLite) que create_all no hace por sí solo.
+
+Se ejecutan al arrancar y son idempotentes: solo agregan lo que falta.
+Con varios workers todos arrancan a la vez: BEGIN IMMEDIATE hace que uno
+migre y los demás esperen su turno (y ya no encuentren nada que hacer).
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+import horario, models
+
+# Índices reemplazados por otros más completos
+_INDICES_OBSOLETOS = ["ix_citas_doctor_id", "ix_citas_doctor_fecha"]
+# Milisegundos que un worker espera a que otro termine de migrar
+ESPERA_MS = 120000
+
+
+def _agregar_columnas(conexion):
+    """Columnas nuevas en tablas que ya existían (ALTER TABLE ... ADD COLUMN)"""
+    inspector = inspect(conexion)
+    nuevas = {
+        "configuracion": [("zona_horaria", f"VARCHAR DEFAULT '{horario.ZONA_POR_DEFECTO}'")],
+        "citas": [("inicio_min", "INTEGER"), ("fin_min", "INTEGER")],
+        "pacientes": [("fusionado_en", "INTEGER REFERENCES pacientes(id)")],
+    }
+    for tabla, columnas in nuevas.items():
+        existentes = {c["name"] for c in inspector.get_columns(tabla)}
+        for nombre, tipo in columnas:
+            if nombre not in existentes:
+                conexion.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {nombre} {tipo}"))
+
+
+def _rellenar_minutos(conexion):
+    """Citas antiguas: la fecha guardada es hora local del consultorio -> minutos epoch"""
+    pendientes = conexion.execute(
+        text("SELECT id, fecha_inicio, fecha_fin FROM citas WHERE inicio_min IS NULL")
+    ).fetchall()
+    if not pendientes:
+        return
+    nombre_zona = conexion.execute(text("SELECT zona_horaria FROM configuracion LIMIT 1")).scalar()
+    tz = horario.zona(nombre_zona)
+    filas, sin_fecha, largas = [], [], []
+    for cita_id, inicio, fin in pendientes:
+        if inicio is None or fin is None:
+            sin_fecha.append(cita_id)  # Quedan con inicio_min NULL: fuera de choques y del calendario
+            continue
+        inicio = horario.a_minutos(datetime.fromisoformat(str(inicio)), tz)
+        fin = horario.a_minutos(datetime.fromisoformat(str(fin)), tz)
+        if fin - inicio > horario.MAX_DURACION_MIN:
+            largas.append(cita_id)
+        filas.append({"id": cita_id, "inicio": inicio, "fin": fin})
+    if filas:
+        conexion.execute(
+            text("UPDATE citas SET inicio_min = :inicio, fin_min = :fin WHERE id = :id"), filas
+        )
+        print(f"✓ Migración: {len(filas)} citas convertidas a minutos epoch")
+    if sin_fecha:
+        print(f"⚠ Migración: {len(sin_fecha)} citas sin fecha de inicio o fin, no convertidas (ids {sin_fecha})")
+    if largas:
+        # La búsqueda de choques asume MAX_DURACION_MIN: estas citas no bloquean su horario completo
+        print(f"⚠ Migración: {len(largas)} citas duran más de 24 horas, corrija su fecha de fin (ids {largas})")
+
+
+def aplicar(engine):
+    with engine.connect() as conexion:
+        # pysqlite no emite BEGIN antes del DDL: lo pedimos explícito y con candado de escritura
+        espera_original = conexion.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        conexion.exec_driver_sql(f"PRAGMA busy_timeout={ESPERA_MS}")
+        try:
+            conexion.exec_driver_sql("BEGIN IMMEDIATE")
+            _migrar(conexion)
+            conexion.commit()
+        finally:
+            conexion.exec_driver_sql(f"PRAGMA busy_timeout={espera_original}")
+
+
+def _migrar(conexion):
+    _agregar_columnas(conexion)
+    _rellenar_minutos(conexion)
+    for nombre in _INDICES_OBSOLETOS:
+        conexion.execute(text(f"DROP INDEX IF EXISTS {nombre}"))
+    # create_all no agrega índices nuevos a tablas que ya existían
+    for tabla in models.Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(bind=conexion, checkfirst=True)
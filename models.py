@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
+from datetime import datetime
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -37,6 +38,8 @@ class Paciente(Base):
     
     # Soft Delete
     activo = Column(Boolean, default=True)
+    # Si fue fusionado como duplicado: id del paciente que quedó (ver duplicados.py)
+    fusionado_en = Column(Integer, ForeignKey("pacientes.id"), nullable=True)
     
     # --- CAMPOS DE HISTORIAL MÉDICO ---
     alergias = Column(Text, default="Ninguna conocida")
@@ -49,12 +52,18 @@ class Paciente(Base):
 class Cita(Base):
     """Tabla de Citas - Con validación manual de choques"""
     __tablename__ = "citas"
+    # Agenda/choques de un doctor por rango (y búsqueda por doctor_id, que es el prefijo)
+    __table_args__ = (Index("ix_citas_doctor_inicio", "doctor_id", "inicio_min"),)
     
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctores.id"))
-    paciente_id = Column(Integer, ForeignKey("pacientes.id"))
+    paciente_id = Column(Integer, ForeignKey("pacientes.id"), index=True)
+    # Hora local del consultorio (para mostrar)
     fecha_inicio = Column(DateTime)
     fecha_fin = Column(DateTime)
+    # Mismo intervalo en minutos epoch UTC (para comparar, ver horario.py)
+    inicio_min = Column(Integer)
+    fin_min = Column(Integer)
     motivo = Column(String)
     activo = Column(Boolean, default=True)
 
@@ -72,6 +81,7 @@ class Configuracion(Base):
     hora_cierre = Column(String, default="20:00")    # Formato "HH:MM"
     # Días laborales: String separado por comas (0=Domingo, 1=Lunes...)
     dias_laborales = Column(String, default="1,2,3,4,5")
+    zona_horaria = Column(String, default="America/La_Paz")  # Nombre IANA
 
 class Admin(Base):
     """Tabla de Administrador - Sistema de Login"""
@@ -80,3 +90,22 @@ class Admin(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, default="admin")
     password = Column(String, default="admin")  # En producción usar hash (bcrypt)
+
+class VersionCache(Base):
+    """Tabla de Versiones - Coherencia de cachés entre workers"""
+    __tablename__ = "versiones_cache"
+    
+    clave = Column(String, primary_key=True)  # Ej: "doctores", "config", "citas"
+    version = Column(Integer, default=0)
+
+class Cambio(Base):
+    """Tabla de Cambios - Bitácora monotónica para sincronizar recepciones"""
+    __tablename__ = "cambios"
+    # AUTOINCREMENT: los ids nunca se reutilizan, así sirven de cursor
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True)
+    tabla = Column(String)         # "citas", "pacientes" o "doctores"
+    registro_id = Column(Integer)
+    operacion = Column(String, default="guardado")  # "guardado" o "borrado"
+    fecha = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,96 @@
+"""Operaciones por lote de la papelera: baja lógica, restauración y purga.
+
+Cada operación es UNA sentencia por tabla sobre toda la lista de ids y no hace
+commit: quien la llama confirma todo junto, en una sola transacción.
+
+Reglas de cascada (las mismas para uno o para cientos de registros):
+- Dar de baja un paciente da de baja también sus citas. Dar de baja un doctor
+  solo lo saca a él: su agenda queda intacta para cuando se lo restaure.
+- Restaurar devuelve solo el registro pedido; sus citas siguen en la papelera.
+  Un paciente fusionado que se restaura deja de redirigir a su principal.
+- Purgar borra para siempre registros que YA están en la papelera, junto con
+  todas sus citas (usa los índices de citas.paciente_id y citas.doctor_id).
+"""
+from sqlalchemy import delete, select, update
+
+import cambios, models
+from coherencia import marcar_cambio
+
+MODELOS = {
+    "doctores": models.Doctor,
+    "pacientes": models.Paciente,
+    "citas": models.Cita,
+}
+
+# Bajas que arrastran a las citas (el doctor no: así era antes de la papelera por lotes)
+_CASCADA_BAJA = {
+    "pacientes": models.Cita.paciente_id,
+}
+
+# Columna de citas que apunta a cada tabla padre (para la purga)
+_FK_CITAS = {
+    "doctores": models.Cita.doctor_id,
+    "pacientes": models.Cita.paciente_id,
+}
+
+# Claves de caché afectadas por cada tabla (ver coherencia.py)
+_CLAVES_CACHE = {
+    "doctores": ("doctores", "citas"),
+    "pacientes": ("citas",),
+    "citas": ("citas",),
+}
+
+
+def _cambiar_estado(db, tabla, ids, activo):
+    modelo = MODELOS[tabla]
+    filtro = modelo.id.in_(ids)
+    cambios.registrar_consulta(db, tabla, select(modelo.id).where(filtro))
+    return db.execute(update(modelo).where(filtro).values(activo=activo)).rowcount
+
+
+def desactivar(db, tabla, ids):
+    """Baja lógica (pacientes: con cascada a citas). Devuelve cuántos registros se encontraron"""
+    if tabla in _CASCADA_BAJA:
+        fk = _CASCADA_BAJA[tabla]
+        filtro = fk.in_(ids), models.Cita.activo == True
+        cambios.registrar_consulta(db, "citas", select(models.Cita.id).where(*filtro))
+        db.execute(update(models.Cita).where(*filtro).values(activo=False))
+    afectados = _cambiar_estado(db, tabla, ids, activo=False)
+    marcar_cambio(db, *_CLAVES_CACHE[tabla])
+    return afectados
+
+
+def restaurar(db, tabla, ids):
+    """Devuelve los registros a activos. Devuelve cuántos registros se encontraron"""
+    afectados = _cambiar_estado(db, tabla, ids, activo=True)
+    if tabla == "pacientes":
+        db.execute(update(models.Paciente).where(models.Paciente.id.in_(ids)).values(fusionado_en=None))
+    marcar_cambio(db, *_CLAVES_CACHE[tabla])
+    return afectados
+
+
+def purgar(db, tabla, ids):
+    """Borrado definitivo de registros inactivos y sus citas. Devuelve cuántos se borraron"""
+    modelo = MODELOS[tabla]
+    filtro = modelo.id.in_(ids), modelo.activo == False
+    if tabla in _FK_CITAS:
+        # Solo las citas de padres que realmente se van a borrar
+        filtro_citas = _FK_CITAS[tabla].in_(select(modelo.id).where(*filtro))
+        cambios.registrar_consulta(db, "citas", select(models.Cita.id).where(filtro_citas), "borrado")
+        db.execute(delete(models.Cita).where(filtro_citas))
+    if tabla == "pacientes":
+        # Duplicados fusionados en un paciente que desaparece: ya no redirigen
+        huerfanos = models.Paciente.fusionado_en.in_(select(modelo.id).where(*filtro))
+        db.execute(update(models.Paciente).where(huerfanos).values(fusionado_en=None),
+                   execution_options={"synchronize_session": False})
+    cambios.registrar_consulta(db, tabla, select(modelo.id).where(*filtro), "borrado")
+    afectados = db.execute(delete(modelo).where(*filtro)).rowcount
+    marcar_cambio(db, *_CLAVES_CACHE[tabla])
+    return afectados
+
+
+ACCIONES = {
+    "desactivar": desactivar,
+    "restaurar": restaurar,
+    "purgar": purgar,
+}
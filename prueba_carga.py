@@ -0,0 +1,148 @@
+"""Prueba de carga: ráfaga de reservas + lecturas del calendario en paralelo.
+
+Uso (con el servidor corriendo sobre una COPIA de medicitas.db, porque crea citas):
+    uvicorn main:app --workers 2
+    python prueba_carga.py --reservas 300 --hilos 50
+
+Muestra p50/p95/p99 de lecturas y escrituras, cuántas reservas recibieron
+429 (contrapresión) y la profundidad de las colas de admisión.
+
+Con --con-respaldo (correr en la carpeta del servidor) repite la ráfaga
+mientras se crea un respaldo en caliente por segundo, y termina con código 1
+si el p99 de las escrituras empeora más que --margen (por defecto 50%).
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def pedir(url, datos=None):
+    """Devuelve (status, milisegundos)"""
+    cuerpo = urllib.parse.urlencode(datos).encode() if datos else None
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, data=cuerpo, timeout=30) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, (time.perf_counter() - inicio) * 1000
+
+
+def reserva(base, n, doctores):
+    """Cada reserva cae en un hueco distinto (año 2099 para no chocar con datos reales)"""
+    dia = 1 + (n // 40) % 28
+    minuto = (n % 40) * 15
+    h, m = 8 + minuto // 60, minuto % 60
+    fecha = f"2099-01-{dia:02d}T{h:02d}:{m:02d}:00"
+    fin = f"2099-01-{dia:02d}T{h:02d}:{m + 14:02d}:00"
+    return pedir(f"{base}/agendar", {
+        "doctor_id": random.choice(doctores),
+        "fecha_inicio_str": fecha,
+        "fecha_fin_str": fin,
+        "paciente_ci": str(1000000 + n),
+        "paciente_nombre": f"Paciente Carga {n}",
+        "paciente_telefono": f"7{n:07d}"[-8:],
+        "motivo": "Prueba de carga",
+    })
+
+
+def rafaga(args, doctores, titulo, desde=0):
+    """Una ráfaga de reservas (numeradas desde `desde`) con lecturas en paralelo"""
+    escrituras, lecturas, rechazos = [], [], []
+    fin_rafaga = threading.Event()
+
+    def lector():
+        while not fin_rafaga.is_set():
+            status, ms = pedir(f"{args.url}/api/citas/{random.choice(doctores)}")
+            lecturas.append(ms)
+
+    lectores = [threading.Thread(target=lector) for _ in range(4)]
+    for t in lectores:
+        t.start()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        for status, ms in pool.map(lambda n: reserva(args.url, n, doctores), range(desde, desde + args.reservas)):
+            (rechazos if status == 429 else escrituras).append(ms)
+    duracion = time.perf_counter() - inicio
+    fin_rafaga.set()
+    for t in lectores:
+        t.join()
+
+    print("=" * 60)
+    print(f"{titulo}: {args.reservas} reservas en {duracion:.1f}s ({args.hilos} hilos)")
+    print("=" * 60)
+    for nombre, datos in (("Escrituras", escrituras), ("Rechazos 429", rechazos), ("Lecturas", lecturas)):
+        print(f"{nombre:14} n={len(datos):5}  p50={percentil(datos, 50):7.1f}ms  "
+              f"p95={percentil(datos, 95):7.1f}ms  p99={percentil(datos, 99):7.1f}ms")
+    return percentil(escrituras, 99)
+
+
+def rafaga_con_respaldo(args, doctores):
+    """La misma ráfaga mientras se respalda medicitas.db cada segundo"""
+    import respaldo
+
+    directorio = tempfile.mkdtemp(prefix="respaldos-prueba-")
+    fin = threading.Event()
+    creados = []
+
+    def respaldar():
+        while not fin.is_set():
+            inicio = time.perf_counter()
+            respaldo.crear(directorio=directorio, conservar=2)
+            creados.append((time.perf_counter() - inicio) * 1000)
+            fin.wait(1)
+
+    hilo = threading.Thread(target=respaldar)
+    hilo.start()
+    p99 = rafaga(args, doctores, "RÁFAGA CON RESPALDO", desde=args.reservas)
+    fin.set()
+    hilo.join()
+    print(f"Respaldos     n={len(creados):5}  p50={percentil(creados, 50):7.1f}ms  (en {directorio})")
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--reservas", type=int, default=300)
+    parser.add_argument("--hilos", type=int, default=50)
+    parser.add_argument("--doctores", default="1,2,3")
+    parser.add_argument("--con-respaldo", action="store_true",
+                        help="Repetir la ráfaga con respaldos en caliente corriendo")
+    parser.add_argument("--margen", type=float, default=0.5,
+                        help="Empeoramiento tolerado del p99 de escrituras con respaldo (0.5 = 50%%)")
+    args = parser.parse_args()
+    doctores = [int(d) for d in args.doctores.split(",")]
+
+    p99_sin = rafaga(args, doctores, "RÁFAGA")
+    p99_con = rafaga_con_respaldo(args, doctores) if args.con_respaldo else None
+    with urllib.request.urlopen(f"{args.url}/api/admision") as r:
+        print("\nColas de admisión (worker que respondió):")
+        print(json.dumps(json.load(r), indent=2))
+
+    if p99_con is not None:
+        limite = p99_sin * (1 + args.margen)
+        if p99_con > limite:
+            print(f"\n✗ Con respaldo el p99 de escrituras subió a {p99_con:.0f}ms (límite {limite:.0f}ms)")
+            raise SystemExit(1)
+        print(f"\n✓ p99 de escrituras con respaldo: {p99_con:.0f}ms (límite {limite:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Respaldos en caliente de medicitas.db (sin detener el servidor).
+
+Usa la API de backup de SQLite: copia la base página por página en pasos
+pequeños, con una pausa entre pasos para que los escritores sigan trabajando.
+Si otra conexión escribe a mitad de la copia SQLite la reinicia; tras unos
+pocos reinicios se copia de un solo paso, que en modo WAL lee una foto fija
+de la base y tampoco bloquea a quien está agendando.
+
+Uso por consola:
+    python respaldo.py crear
+    python respaldo.py listar
+    python respaldo.py verificar respaldos/medicitas-20250310-120000.db
+    python respaldo.py restaurar respaldos/medicitas-20250310-120000.db
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import cambios, database
+
+# --- CONFIGURACIÓN (100% personalizable) ---
+RUTA_BD = database.engine.url.database
+DIRECTORIO = "respaldos"
+INTERVALO_HORAS = 6      # Cada cuánto respalda el servidor por sí solo
+CONSERVAR = 28           # Cuántos respaldos se guardan (los más viejos se borran)
+PAGINAS_POR_PASO = 256   # Páginas copiadas por paso (1 página = 4 KB)
+PAUSA_ENTRE_PASOS = 0.005
+MAX_REINICIOS = 3
+
+
+class RespaldoInvalido(Exception):
+    pass
+
+
+def verificar(ruta):
+    """PRAGMA integrity_check + tablas principales presentes. Lanza RespaldoInvalido"""
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    try:
+        resultado = conexion.execute("PRAGMA integrity_check").fetchone()[0]
+        if resultado != "ok":
+            raise RespaldoInvalido(f"{ruta}: {resultado}")
+        tablas = {f[0] for f in conexion.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        faltan = {"doctores", "pacientes", "citas"} - tablas
+        if faltan:
+            raise RespaldoInvalido(f"{ruta}: faltan tablas {sorted(faltan)}")
+    except sqlite3.DatabaseError as e:
+        raise RespaldoInvalido(f"{ruta}: {e}") from e
+    finally:
+        conexion.close()
+
+
+def _copiar(origen, destino, paginas=PAGINAS_POR_PASO, pausa=PAUSA_ENTRE_PASOS):
+    """Copia en pasos pequeños; si se reinicia demasiado, copia de un solo paso"""
+    estado = {"restante": None, "reinicios": 0}
+
+    def progreso(_status, restante, _total):
+        if estado["restante"] is not None and restante > estado["restante"]:
+            estado["reinicios"] += 1  # Alguien escribió: SQLite empezó de nuevo
+            if estado["reinicios"] > MAX_REINICIOS:
+                raise InterruptedError
+        estado["restante"] = restante
+
+    try:
+        origen.backup(destino, pages=paginas, progress=progreso, sleep=pausa)
+    except InterruptedError:
+        origen.backup(destino)
+
+
+def crear(origen=RUTA_BD, directorio=DIRECTORIO, conservar=CONSERVAR):
+    """Respaldo verificado en `directorio`; devuelve su ruta"""
+    os.makedirs(directorio, exist_ok=True)
+    nombre = f"medicitas-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    final = os.path.join(directorio, nombre)
+    # Temporal único: el programador y `respaldo.py crear` pueden coincidir en el mismo segundo
+    descriptor, temporal = tempfile.mkstemp(prefix=".medicitas-", suffix=".tmp", dir=directorio)
+    os.close(descriptor)
+
+    try:
+        conexion_origen = sqlite3.connect(origen, timeout=30)
+        conexion_destino = sqlite3.connect(temporal)
+        try:
+            _copiar(conexion_origen, conexion_destino)
+            conexion_destino.execute("PRAGMA journal_mode=DELETE")  # Un solo archivo, sin -wal/-shm
+        finally:
+            conexion_destino.close()
+            conexion_origen.close()
+        verificar(temporal)
+    except BaseException:
+        os.remove(temporal)
+        raise
+    os.replace(temporal, final)
+    aplicar_retencion(directorio, conservar)
+    return final
+
+
+def listar(directorio=DIRECTORIO):
+    """Respaldos existentes, del más viejo al más nuevo"""
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(
+        os.path.join(directorio, f) for f in os.listdir(directorio)
+        if f.startswith("medicitas-") and f.endswith(".db")
+    )
+
+
+def aplicar_retencion(directorio=DIRECTORIO, conservar=CONSERVAR):
+    """Borra los respaldos más viejos; el más nuevo se conserva siempre"""
+    for viejo in listar(directorio)[:-max(conservar, 1)]:
+        try:
+            os.remove(viejo)
+        except FileNotFoundError:
+            pass  # Otro proceso que respaldaba a la vez ya lo borró
+
+
+def _estado_bitacora(conexion):
+    """(último id de `cambios`, versiones de caché) de una base; vacío si no tiene esas tablas"""
+    try:
+        ultimo = conexion.execute(
+            "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'cambios'), 0),"
+            " COALESCE((SELECT MAX(id) FROM cambios), 0))"
+        ).fetchone()[0]
+        versiones = dict(conexion.execute("SELECT clave, version FROM versiones_cache"))
+    except sqlite3.OperationalError:
+        return 0, {}
+    return ultimo, versiones
+
+
+def _continuar_bitacora(conexion, ultimo, versiones):
+    """Tras restaurar: los ids de `cambios` siguen desde donde iban y todas las versiones suben.
+
+    Así ningún cursor de /api/sync se reutiliza, ningún worker sirve su caché vieja y
+    la generación de la bitácora cambia: las recepciones saben que deben resincronizar desde 0.
+    """
+    _, restauradas = _estado_bitacora(conexion)
+    with conexion:
+        if conexion.execute("SELECT 1 FROM sqlite_master WHERE name = 'cambios'").fetchone():
+            actualizadas = conexion.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'cambios'", (ultimo,)
+            ).rowcount
+            if not actualizadas:
+                conexion.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('cambios', ?)", (ultimo,))
+        if conexion.execute("SELECT 1 FROM sqlite_master WHERE name = 'versiones_cache'").fetchone():
+            for clave in set(versiones) | set(restauradas) | {cambios.CLAVE_GENERACION}:
+                version = max(versiones.get(clave, 0), restauradas.get(clave, 0)) + 1
+                conexion.execute(
+                    "INSERT INTO versiones_cache (clave, version) VALUES (?, ?) "
+                    "ON CONFLICT(clave) DO UPDATE SET version = excluded.version",
+                    (clave, version),
+                )
+
+
+def restaurar(respaldo, destino=RUTA_BD):
+    """Copia un respaldo verificado sobre la base en uso (todo o nada)"""
+    verificar(respaldo)
+    conexion_respaldo = sqlite3.connect(f"file:{respaldo}?mode=ro", uri=True)
+    conexion_destino = sqlite3.connect(destino, timeout=30)
+    try:
+        ultimo, versiones = _estado_bitacora(conexion_destino)
+        conexion_respaldo.backup(conexion_destino)
+        _continuar_bitacora(conexion_destino, ultimo, versiones)
+    finally:
+        conexion_destino.close()
+        conexion_respaldo.close()
+
+
+# --- RESPALDO PROGRAMADO (hilo dentro del servidor) ---
+def _toca_respaldar(directorio, intervalo_horas):
+    respaldos = listar(directorio)
+    return not respaldos or time.time() - os.path.getmtime(respaldos[-1]) >= intervalo_horas * 3600
+
+
+def _con_candado(directorio, accion):
+    """Con varios workers, solo uno respalda: el que crea el archivo candado"""
+    os.makedirs(directorio, exist_ok=True)
+    candado = os.path.join(directorio, ".respaldo.lock")
+    try:
+        if time.time() - os.path.getmtime(candado) > 3600:
+            os.remove(candado)  # Candado de un proceso que murió a medio respaldo
+    except FileNotFoundError:
+        pass
+    try:
+        descriptor = os.open(candado, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return
+    try:
+        accion()
+    finally:
+        os.close(descriptor)
+        os.remove(candado)
+
+
+def iniciar_programador(directorio=DIRECTORIO, intervalo_horas=INTERVALO_HORAS):
+    """Hilo que respalda cada `intervalo_horas` (revisa cada minuto)"""
+    def ciclo():
+        while True:
+            try:
+                if _toca_respaldar(directorio, intervalo_horas):
+                    _con_candado(directorio, lambda: print(f"✓ Respaldo creado: {crear(directorio=directorio)}"))
+            except Exception as e:
+                print(f"✗ Error en respaldo programado: {e}")
+            time.sleep(60)
+
+    hilo = threading.Thread(target=ciclo, name="respaldos", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Respaldos en caliente de medicitas.db")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("crear", help="Crear un respaldo ahora")
+    sub.add_parser("listar", help="Listar respaldos")
+    p_verificar = sub.add_parser("verificar", help="Verificar integridad de un respaldo")
+    p_verificar.add_argument("archivo")
+    p_restaurar = sub.add_parser("restaurar", help="Restaurar un respaldo sobre medicitas.db")
+    p_restaurar.add_argument("archivo")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == "crear":
+            print(f"✓ Respaldo creado: {crear()}")
+        elif args.comando == "listar":
+            for ruta in listar():
+                print(f"{ruta}  ({os.path.getsize(ruta) // 1024} KB)")
+        elif args.comando == "verificar":
+            verificar(args.archivo)
+            print(f"✓ {args.archivo} está íntegro")
+        elif args.comando == "restaurar":
+            restaurar(args.archivo)
+            print(f"✓ {RUTA_BD} restaurada desde {args.archivo}")
+            print("⚠ Cambió la generación de /api/sync: las recepciones se resincronizan desde cero")
+    except RespaldoInvalido as e:
+        print(f"✗ Respaldo inválido: {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
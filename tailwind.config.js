@@ -0,0 +1,6 @@
+/** Tailwind: solo se generan las clases que aparecen en las plantillas */
+module.exports = {
+  content: ["./templates/**/*.html"],
+  theme: { extend: {} },
+  plugins: [],
+};
@@ -0,0 +1,58 @@
+"""Pruebas de admision.py: una ráfaga de reservas contra la cola de escrituras, sin servidor.
+    python -m pytest -q test_admision.py
+"""
+import asyncio
+import time
+
+import admision
+
+SERVICIO = 0.005  # Segundos que "tarda" cada reserva
+
+
+def _rafaga(pedidos, max_por_doctor=16):
+    """Lanza todos los pedidos (doctor_id) a la vez; devuelve [(doctor_id, estado, segundos)]"""
+    cola = admision.ColaEscrituraPorDoctor("prueba", concurrencia=1, max_cola=64, max_por_doctor=max_por_doctor)
+
+    async def reservar(doctor_id):
+        llegada = time.perf_counter()
+        try:
+            inicio = await cola.entrar(doctor_id)
+        except admision.Saturado:
+            return doctor_id, 429, time.perf_counter() - llegada
+        await asyncio.sleep(SERVICIO)
+        cola.salir(inicio)
+        return doctor_id, 200, time.perf_counter() - llegada
+
+    async def todos():
+        return await asyncio.gather(*(reservar(d) for d in pedidos))
+
+    return asyncio.run(todos()), cola
+
+
+def _p99(valores):
+    return sorted(valores)[int(len(valores) * 0.99)]
+
+
+def test_rafaga_acota_p99_y_rechaza_al_instante():
+    resultados, cola = _rafaga([1] * 100)
+    admitidos = [s for _, estado, s in resultados if estado == 200]
+    rechazados = [s for _, estado, s in resultados if estado == 429]
+
+    # Uno pasa directo, 16 esperan (max_por_doctor) y el resto recibe 429
+    assert len(admitidos) == 17 and len(rechazados) == 83
+    assert cola.metricas()["en_cola"] == 0 and cola.activos == 0
+    # El 429 no espera turno
+    assert max(rechazados) < SERVICIO
+    # La espera queda acotada por la cola, no por el tamaño de la ráfaga (100 x SERVICIO)
+    assert _p99(admitidos) < len(admitidos) * SERVICIO * 1.5
+
+
+def test_doctor_muy_pedido_no_acapara_la_cola():
+    # 16 reservas de un especialista llegan ANTES que las de otros dos doctores
+    resultados, _ = _rafaga([1] * 17 + [2, 2, 3, 3])
+    # Los doctores con poca demanda nunca reciben 429 por culpa del especialista
+    assert all(estado == 200 for doc, estado, _ in resultados if doc != 1)
+    espera = {d: max(s for doc, estado, s in resultados if doc == d and estado == 200) for d in (1, 2, 3)}
+
+    # En ronda, los demás doctores no esperan a que se vacíe la fila del especialista
+    assert max(espera[2], espera[3]) < espera[1] / 2
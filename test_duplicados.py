@@ -0,0 +1,134 @@
+"""Pruebas de duplicados.py: claves fonéticas y fusión de pacientes.
+
+Corren sobre una BD temporal (ver conftest.py), nunca sobre medicitas.db:
+    python -m pytest -q test_duplicados.py
+"""
+import random
+import time
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+import duplicados
+
+
+@pytest.fixture(scope="module")
+def app():
+    """(cliente, database, models) sobre la BD temporal, con el usuario admin"""
+    import database, main, models
+    db = database.SessionLocal()
+    if not db.query(models.Admin).first():
+        db.add(models.Admin(username="admin", password="admin"))
+        db.commit()
+    db.close()
+    # Sin `with`: no se dispara el startup (ni el programador de respaldos)
+    return TestClient(main.app), database, models
+
+
+def _agendar(cliente, ci, nombre, dia):
+    return cliente.post("/agendar", data={
+        "doctor_id": 1,
+        "fecha_inicio_str": f"2099-01-{dia:02d}T09:00:00",
+        "fecha_fin_str": f"2099-01-{dia:02d}T09:30:00",
+        "paciente_ci": ci,
+        "paciente_nombre": nombre,
+        "paciente_telefono": "71234567",
+        "motivo": "Control",
+    }).json()
+
+
+def test_ci_de_duplicado_fusionado_agenda_en_el_principal(app):
+    cliente, database, models = app
+    assert _agendar(cliente, "4567890", "Juan Pérez", 1)["status"] == "ok"
+    assert _agendar(cliente, "4567891", "Juan Peres", 2)["status"] == "ok"
+
+    db = database.SessionLocal()
+    a = db.query(models.Paciente).filter(models.Paciente.ci == "4567890").one()
+    b = db.query(models.Paciente).filter(models.Paciente.ci == "4567891").one()
+    cliente.post("/login", data={"username": "admin", "password": "admin"}, follow_redirects=False)
+    r = cliente.post("/admin/paciente/fusionar", data={"principal_id": a.id, "duplicados_ids": [b.id]})
+    assert r.json()["status"] == "ok"
+
+    # Reservar otra vez con el CI del duplicado NO lo revive
+    assert _agendar(cliente, "4567891", "Juan Peres", 3)["status"] == "ok"
+    db.expire_all()
+    b = db.get(models.Paciente, b.id)
+    assert not b.activo and b.fusionado_en == a.id
+    assert {c.paciente_id for c in db.query(models.Cita)} == {a.id}
+
+    # Las búsquedas por CI también llevan al principal
+    encontrado = cliente.get("/api/paciente/4567891").json()
+    assert encontrado["encontrado"] and encontrado["ci"] == "4567890"
+    assert [p["id"] for p in cliente.get("/api/buscar-paciente?q=456789").json()] == [a.id]
+    db.close()
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Pérez", "Peres"),
+    ("Villca", "Bilca"),
+    ("Villca", "Vilca"),
+    ("Velásquez", "Velazquez"),
+])
+def test_variantes_comparten_codigo_fonetico(a, b):
+    assert duplicados.codigo_fonetico(a) == duplicados.codigo_fonetico(b)
+
+
+def test_variantes_comparten_clave_de_bloque():
+    a = duplicados.claves_bloque("4567890", "Juan Villca", "")
+    b = duplicados.claves_bloque("9999999", "Juan Bilca", "")
+    assert set(a) & set(b)
+
+
+def test_ejemplo_del_docstring():
+    assert duplicados.codigo_fonetico("Velásquez") == "blsks"
+
+
+def _bloques(filas):
+    """(pacientes, bloques) como los arma buscar_candidatos, sin BD"""
+    pacientes, bloques = {}, defaultdict(list)
+    for id_, ci, nombre, telefono in filas:
+        pacientes[id_] = (id_, ci, duplicados.nombre_normalizado(nombre), telefono, nombre)
+        for clave in duplicados.claves_bloque(ci, nombre, telefono):
+            bloques[clave].append(id_)
+    return pacientes, [b for b in bloques.items() if len(b[1]) > 1]
+
+
+def test_ci_correlativos_no_disparan_los_pares():
+    # Benchmark: C.I. correlativos (como en un padrón real). Con solo el C.I. en la
+    # clave cada diez pacientes formaban un bloque: ~4.5 pares por paciente
+    azar = random.Random(1)
+    nombres = ["Juan", "María", "Luis", "Ana", "Carlos", "Rosa", "Jorge", "Carmen", "José", "Elena"]
+    apellidos = ["Mamani", "Quispe", "Condori", "Choque", "Flores", "Gutiérrez", "Rojas", "Vargas",
+                 "Pérez", "López", "Villca", "Apaza", "Huanca", "Torrez", "Cruz", "Ticona", "Poma", "Ramos"]
+    filas = [(i, str(1000000 + i), f"{azar.choice(nombres)} {azar.choice(apellidos)} {azar.choice(apellidos)}",
+              "7%07d" % i) for i in range(50000)]
+    inicio = time.perf_counter()
+    pacientes, bloques = _bloques(filas)
+    pares = duplicados.pares_candidatos(pacientes, bloques)
+    segundos = time.perf_counter() - inicio
+
+    assert len(pares) < len(filas), len(pares)
+    assert segundos < 5, segundos
+
+
+def test_bloque_grande_se_parte_y_el_excesivo_se_informa():
+    # Mismo nombre que 60 personas más: el bloque se parte por el C.I. sin los dos últimos dígitos
+    filas = [(i, str(2000000 + 100 * i), "Juan Mamani", "") for i in range(60)]
+    filas += [(100, "3456789", "Juan Mamani", ""), (101, "3456788", "Juan Mamani", "")]
+    # 60 pacientes con el mismo celular y el mismo nombre: no hay cómo partirlo
+    filas += [(200 + i, str(5000000 + 100 * i), "Rosa Flores", "22441234") for i in range(60)]
+    pacientes, bloques = _bloques(filas)
+    omitidos = []
+    pares = duplicados.pares_candidatos(pacientes, bloques, omitidos)
+
+    assert (100, 101) in pares
+    assert omitidos == ["t:22441234"]
+
+
+def test_bloque_del_tamano_maximo_se_revisa_completo():
+    filas = [(i, str(2000000 + 1000 * i), "Juan Mamani", "") for i in range(duplicados.MAX_BLOQUE)]
+    pacientes, bloques = _bloques(filas)
+    omitidos = []
+    pares = duplicados.pares_candidatos(pacientes, bloques, omitidos)
+    assert len(pares) == duplicados.MAX_BLOQUE * (duplicados.MAX_BLOQUE - 1) // 2 and not omitidos
@@ -0,0 +1,21 @@
+"""Pruebas de estaticos.py: el manifest se toma aunque aparezca con el servidor ya arrancado.
+    python -m pytest -q test_estaticos.py
+"""
+import json
+import os
+
+import estaticos
+
+
+def test_asset_toma_el_manifest_construido_despues(tmp_path, monkeypatch):
+    monkeypatch.setattr(estaticos, "DIRECTORIO_DIST", str(tmp_path))
+    monkeypatch.setattr(estaticos, "_manifest", (None, {}))
+    assert estaticos.asset("calendario.js") is None
+
+    (tmp_path / "manifest.json").write_text(json.dumps({"calendario.js": "calendario.aaaa.js"}))
+    assert estaticos.asset("calendario.js") == "/static/calendario.aaaa.js"
+
+    # Una nueva construcción cambia el nombre con hash
+    (tmp_path / "manifest.json").write_text(json.dumps({"calendario.js": "calendario.bbbb.js"}))
+    os.utime(tmp_path / "manifest.json", ns=(1, 1))
+    assert estaticos.asset("calendario.js") == "/static/calendario.bbbb.js"
@@ -0,0 +1,140 @@
+"""Pruebas de respaldo.py sobre bases temporales (nunca sobre medicitas.db):
+    python -m pytest -q test_respaldo.py
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+import models, respaldo
+
+# Cuánto puede empeorar el p99 de una escritura mientras se respalda. Un respaldo que
+# bloquee a los escritores los hace esperar la copia entera (>100 ms con esta base)
+MARGEN_MS = 50
+
+
+def _base(tmp_path):
+    """Base vacía con todas las tablas del sistema"""
+    ruta = str(tmp_path / "medicitas.db")
+    motor = create_engine(f"sqlite:///{ruta}")
+    models.Base.metadata.create_all(motor)
+    motor.dispose()
+    return ruta
+
+
+def _anotar_cambios(ruta, n):
+    """Agrega n filas a la bitácora; devuelve el último id"""
+    conexion = sqlite3.connect(ruta)
+    with conexion:
+        for i in range(n):
+            cursor = conexion.execute(
+                "INSERT INTO cambios (tabla, registro_id, operacion) VALUES ('citas', ?, 'guardado')", (i,)
+            )
+    conexion.close()
+    return cursor.lastrowid
+
+
+def _generacion(ruta):
+    conexion = sqlite3.connect(ruta)
+    fila = conexion.execute("SELECT version FROM versiones_cache WHERE clave = 'bitacora'").fetchone()
+    conexion.close()
+    return fila[0] if fila else 0
+
+
+def test_restaurar_no_reutiliza_ids_de_la_bitacora(tmp_path):
+    ruta = _base(tmp_path)
+    _anotar_cambios(ruta, 14)
+    copia = respaldo.crear(origen=ruta, directorio=str(tmp_path / "respaldos"))
+    assert _anotar_cambios(ruta, 2) == 16  # Una recepción ya tiene cursor=16
+
+    respaldo.restaurar(copia, destino=ruta)
+
+    # Los ids siguen desde 17: el cliente no se salta cambios nuevos...
+    assert _anotar_cambios(ruta, 1) == 17
+    # ...y la generación cambió, así que resincroniza desde 0
+    assert _generacion(ruta) == 1
+
+
+
+def test_retencion_conserva_al_menos_uno(tmp_path):
+    directorio = tmp_path / "respaldos"
+    directorio.mkdir()
+    for i in range(3):
+        (directorio / f"medicitas-2025010{i}-120000.db").write_bytes(b"")
+    respaldo.aplicar_retencion(str(directorio), conservar=0)
+    assert [r.rsplit("/", 1)[-1] for r in respaldo.listar(str(directorio))] == ["medicitas-20250102-120000.db"]
+
+
+def test_respaldos_simultaneos_no_comparten_temporal(tmp_path):
+    # El programador y `respaldo.py crear` en el mismo segundo: mismo nombre final
+    ruta = _base(tmp_path)
+    _anotar_cambios(ruta, 2000)
+    directorio = str(tmp_path / "respaldos")
+    errores = []
+
+    def respaldar():
+        try:
+            respaldo.crear(origen=ruta, directorio=directorio, conservar=1)
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=respaldar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert not errores
+    restantes = respaldo.listar(directorio)
+    assert len(restantes) == 1
+    respaldo.verificar(restantes[0])
+    assert [f for f in os.listdir(directorio) if f.endswith(".tmp")] == []
+
+
+def _p99_escrituras(ruta, n=300):
+    """p99 (ms) de n commits pequeños, como los de /agendar"""
+    conexion = sqlite3.connect(ruta, timeout=30)
+    tiempos = []
+    for i in range(n):
+        inicio = time.perf_counter()
+        with conexion:
+            conexion.execute(
+                "INSERT INTO cambios (tabla, registro_id, operacion) VALUES ('citas', ?, 'guardado')", (i,)
+            )
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(0.002)
+    conexion.close()
+    return sorted(tiempos)[int(n * 0.99)]
+
+
+def test_respaldar_no_frena_las_escrituras(tmp_path):
+    ruta = _base(tmp_path)
+    conexion = sqlite3.connect(ruta)
+    conexion.execute("PRAGMA journal_mode=WAL")  # Como la deja database.py
+    with conexion:
+        conexion.executemany(
+            "INSERT INTO pacientes (ci, nombre, telefono, notas_medicas) VALUES (?, ?, ?, ?)",
+            [(str(i), f"Paciente {i}", "71234567", "x" * 200) for i in range(60000)],
+        )
+    conexion.close()
+
+    sin_respaldo = _p99_escrituras(ruta)
+    fin = threading.Event()
+    creados = []
+
+    def respaldar():
+        while not fin.is_set():
+            creados.append(respaldo.crear(origen=ruta, directorio=str(tmp_path / "respaldos"), conservar=1))
+
+    hilo = threading.Thread(target=respaldar)
+    hilo.start()
+    try:
+        con_respaldo = _p99_escrituras(ruta)
+    finally:
+        fin.set()
+        hilo.join()
+
+    assert creados
+    assert con_respaldo <= sin_respaldo + MARGEN_MS, (sin_respaldo, con_respaldo)